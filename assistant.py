@@ -1,18 +1,61 @@
 #!/usr/bin/env python3
 """投资研究助手 - 主程序"""
 
+import io
 import json
 import os
 import sys
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional, Tuple, Dict, List
 
+try:
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.completion import WordCompleter
+except ImportError:  # pragma: no cover - requirements 内依赖，缺失时回退 rich 输入
+    PromptSession = None
+
 from core.openai_client import OpenAIClient
 from core.storage import Storage
 from core.interview import InterviewManager
 from core.environment import EnvironmentCollector
 from core.research import ResearchEngine
 from utils.display import Display
+from utils.json_compat import loads as _json_loads
+
+
+# ==================== 预编译正则（_handle_input / _extract_json 热路径）====================
+
+_ADD_RE = re.compile(r"(?:直接)?(?:添加|新增|导入)\s*(.+?)\s*$")
+_BUY_RE = re.compile(r"(?:我想)?买入?\s*(.+?)\s*$")
+_NEWS_RE = re.compile(r"(.+?)\s*(?:有新消息|有消息|更新)")
+_CHECK_RE = re.compile(r"检查\s*(.+?)\s*$")
+_HISTORY_RE = re.compile(r"(?:查看)?\s*(.+?)\s*(?:的)?\s*历史")
+_VIEW_RE = re.compile(r"查看\s*(.+?)\s*$")
+_DIRECT_UPDATE_RE = re.compile(r"(?:直接|批量|导入|一次性|编辑)\s*(.+?)\s*(?:的)?\s*(?:逻辑|playbook)")
+_UPDATE_RE = re.compile(r"更新\s*(.+?)\s*(?:的)?\s*逻辑")
+_DELETE_RE = re.compile(r"删除\s*(.+?)\s*$")
+
+# fenced 代码块与裸 JSON 花括号分开扫：合进一个 alternation 时，
+# 正文里先出现的裸 { 会贪婪吞掉后面的 fenced 块
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*```")
+_BRACE_SPAN_RE = re.compile(r"\{[\s\S]*\}")
+
+# 精确命令集合（补全词表用；分发路径见 _handle_input 的 match/case）
+_EXIT_COMMANDS = frozenset({"退出", "exit", "quit", "q"})
+_HELP_COMMANDS = frozenset({"帮助", "help", "?"})
+_COMMAND_WORDS = ("查看", "删除", "检查", "买入", "买", "添加", "新增", "导入")
+
+# 多关键词子串匹配：编译成单个交替正则，一次 C 层扫描替代逐词 `in` 扫描
+_PORTFOLIO_KWS_RE = re.compile(r"投资观点|总体策略|总体playbook")
+_DIRECT_EDIT_KWS_RE = re.compile(r"直接|批量|导入|一次性|编辑")
+
+
+@lru_cache(maxsize=512)
+def _stock_id(stock_name: str) -> str:
+    """股票名 → stock_id 规范化（同一会话内重复命中走缓存）"""
+    return stock_name.lower().replace(" ", "_")
 
 
 class InvestmentAssistant:
@@ -42,6 +85,24 @@ class InvestmentAssistant:
         self.current_mode = None  # None, "portfolio_interview", "stock_interview", "environment"
         self.current_stock = None
 
+        # 主循环输入：prompt_toolkit 提供历史回翻 + 命令/股票名补全，
+        # 补全命中后就不会再触发 _show_stock_playbook 的模糊匹配扫描；
+        # 非 TTY（管道/测试）回退到 display.input
+        self._prompt_session = None
+        if PromptSession is not None and sys.stdin.isatty():
+            self._prompt_session = PromptSession()
+
+    def _read_command(self) -> str:
+        """读取一条主循环命令（带补全），回退纯输入"""
+        if self._prompt_session is None:
+            return self.display.input("\n> ")
+        words = sorted(_EXIT_COMMANDS | _HELP_COMMANDS | set(_COMMAND_WORDS))
+        try:
+            words.extend(s["stock_name"] for s in self.storage.list_stocks() if s.get("stock_name"))
+        except Exception:
+            pass
+        return self._prompt_session.prompt("\n> ", completer=WordCompleter(words))
+
     def _setup_api_key(self):
         """设置 API Key"""
         self.display.print_info("首次使用，请设置 OpenAI API Key")
@@ -71,7 +132,7 @@ class InvestmentAssistant:
         """主交互循环"""
         while True:
             try:
-                user_input = self.display.input("\n> ").strip()
+                user_input = self._read_command().strip()
                 if not user_input:
                     continue
 
@@ -87,22 +148,23 @@ class InvestmentAssistant:
 
     def _handle_input(self, user_input: str):
         """处理用户输入"""
+        # 入口统一修剪一次；正则组自带 \s* 边界，后续不再逐处 .strip()
+        user_input = user_input.strip()
         lower_input = user_input.lower()
 
-        # 退出
-        if lower_input in ["退出", "exit", "quit", "q"]:
-            self.display.print("再见！")
-            sys.exit(0)
-
-        # 帮助
-        if lower_input in ["帮助", "help", "?"]:
-            self._show_help()
-            return
+        # 退出/帮助：match 字面量模式，高频精确命令直接跳转
+        match lower_input:
+            case "退出" | "exit" | "quit" | "q":
+                self.display.print("再见！")
+                sys.exit(0)
+            case "帮助" | "help" | "?":
+                self._show_help()
+                return
 
         # 总体 Playbook
-        if any(kw in lower_input for kw in ["投资观点", "总体策略", "总体playbook"]):
+        if _PORTFOLIO_KWS_RE.search(lower_input):
             # 直接一次性输入/导入（不走苏格拉底问答）
-            if any(kw in lower_input for kw in ["直接", "批量", "导入", "一次性", "编辑"]):
+            if _DIRECT_EDIT_KWS_RE.search(lower_input):
                 self._direct_edit_portfolio_playbook()
             elif "更新" in lower_input:
                 self._start_update_portfolio_interview()
@@ -110,16 +172,42 @@ class InvestmentAssistant:
                 self._show_portfolio_playbook()
             return
 
+        # 首词分发：空格分隔的简单命令 match/case 直达，
+        # 歧义命令（"X 有新消息"、"更新 X 逻辑" 等）回退到下方正则级联
+        head, _, rest = user_input.partition(" ")
+        rest = rest.strip()
+        if rest:
+            match head:
+                case "查看":
+                    history_match = _HISTORY_RE.match(user_input)
+                    if history_match:
+                        self._show_history(history_match.group(1))
+                    else:
+                        self._show_stock_playbook(rest)
+                    return
+                case "删除":
+                    self._delete_stock(rest)
+                    return
+                case "检查":
+                    self._start_environment_check(rest)
+                    return
+                case "买入" | "买":
+                    self._start_stock_interview(rest)
+                    return
+                case "添加" | "新增" | "导入":
+                    self._direct_add_stock_playbook(rest)
+                    return
+
         # 个股 Playbook - 直接添加/导入（不走苏格拉底问答）
-        add_match = re.match(r"(?:直接)?(?:添加|新增|导入)\s*(.+)", user_input)
+        add_match = _ADD_RE.match(user_input)
         if add_match:
-            stock_name = add_match.group(1).strip()
+            stock_name = add_match.group(1)
             if stock_name:
                 self._direct_add_stock_playbook(stock_name)
             return
 
         # 个股 Playbook - 买入（苏格拉底访谈）
-        buy_match = re.match(r"(?:我想)?买入?\s*(.+)", user_input)
+        buy_match = _BUY_RE.match(user_input)
         if buy_match or lower_input.startswith("买"):
             stock_name = buy_match.group(1) if buy_match else user_input[1:].strip()
             if stock_name:
@@ -127,39 +215,38 @@ class InvestmentAssistant:
             return
 
         # 个股 - 有新消息
-        news_match = re.match(r"(.+?)(?:有新消息|有消息|更新)", user_input)
-        check_match = re.match(r"检查\s*(.+)", user_input)
+        news_match = _NEWS_RE.match(user_input)
+        check_match = _CHECK_RE.match(user_input)
         if news_match or check_match:
             stock_name = news_match.group(1) if news_match else check_match.group(1)
-            stock_name = stock_name.strip()
             self._start_environment_check(stock_name)
             return
 
         # 查看历史
-        history_match = re.match(r"(?:查看)?(.+?)(?:的)?历史", user_input)
+        history_match = _HISTORY_RE.match(user_input)
         if history_match:
-            stock_name = history_match.group(1).strip()
+            stock_name = history_match.group(1)
             self._show_history(stock_name)
             return
 
         # 查看个股 Playbook
-        view_match = re.match(r"查看\s*(.+)", user_input)
+        view_match = _VIEW_RE.match(user_input)
         if view_match:
-            stock_name = view_match.group(1).strip()
+            stock_name = view_match.group(1)
             self._show_stock_playbook(stock_name)
             return
 
         # 更新个股逻辑
         # - 直接/一次性输入："直接更新 XXX 逻辑" / "编辑 XXX playbook"
-        direct_update_match = re.match(r"(?:直接|批量|导入|一次性|编辑)\s*(.+?)(?:的)?\s*(?:逻辑|playbook)", user_input)
+        direct_update_match = _DIRECT_UPDATE_RE.match(user_input)
         if direct_update_match:
-            stock_name = direct_update_match.group(1).strip()
+            stock_name = direct_update_match.group(1)
             self._direct_edit_stock_playbook(stock_name)
             return
 
-        update_match = re.match(r"更新\s*(.+?)(?:的)?逻辑", user_input)
+        update_match = _UPDATE_RE.match(user_input)
         if update_match:
-            stock_name = update_match.group(1).strip()
+            stock_name = update_match.group(1)
             self._start_update_stock_interview(stock_name)
             return
 
@@ -169,9 +256,9 @@ class InvestmentAssistant:
             return
 
         # 删除
-        delete_match = re.match(r"删除\s*(.+)", user_input)
+        delete_match = _DELETE_RE.match(user_input)
         if delete_match:
-            stock_name = delete_match.group(1).strip()
+            stock_name = delete_match.group(1)
             self._delete_stock(stock_name)
             return
 
@@ -216,13 +303,16 @@ class InvestmentAssistant:
         """Read multi-line input until user enters END on its own line."""
         self.display.print_info(title)
         self.display.print("请粘贴 JSON（可包含 ```json 代码块）。输入 END 结束。\n")
-        lines: List[str] = []
+        # StringIO：单一可扩展缓冲区；大段粘贴时避免 list 持有全部行片段
+        # 再额外分配一次 join 结果
+        buf = io.StringIO()
         while True:
             line = self.display.input("")
             if line.strip() == "END":
                 break
-            lines.append(line)
-        return "\n".join(lines).strip()
+            buf.write(line)
+            buf.write("\n")
+        return buf.getvalue().strip()
 
     _MAX_JSON_INPUT_SIZE = 100_000  # 100 KB limit for JSON paste
 
@@ -234,21 +324,19 @@ class InvestmentAssistant:
             self.display.print_error(f"输入过大（{len(text)} 字符），上限 {self._MAX_JSON_INPUT_SIZE} 字符。")
             return None
 
-        # fenced code blocks first
-        matches = re.findall(r"```(?:json)?\s*([\s\S]*?)\s*```", text)
-        for s in reversed(matches):
+        # fenced 代码块优先（从后往前），全部解析失败才退回裸花括号
+        for s in reversed(_FENCED_JSON_RE.findall(text)):
             try:
-                obj = json.loads(s)
+                obj = _json_loads(s)
                 if isinstance(obj, dict):
                     return obj
             except Exception:
                 pass
 
-        # brace match
-        m = re.search(r"\{[\s\S]*\}", text)
-        if m:
+        brace_match = _BRACE_SPAN_RE.search(text)
+        if brace_match is not None:
             try:
-                obj = json.loads(m.group(0))
+                obj = _json_loads(brace_match.group(0))
                 if isinstance(obj, dict):
                     return obj
             except Exception:
@@ -256,7 +344,7 @@ class InvestmentAssistant:
 
         # whole text
         try:
-            obj = json.loads(text)
+            obj = _json_loads(text)
             if isinstance(obj, dict):
                 return obj
         except Exception:
@@ -270,15 +358,26 @@ class InvestmentAssistant:
         """Deep-merge dicts. Dict values merge recursively; lists/scalars replace.
 
         Protected fields (timestamps, internal IDs) are silently dropped from the patch.
+        Iterative with an explicit stack so deeply nested playbooks avoid
+        per-level Python call overhead.
         """
         out = dict(base or {})
-        for k, v in (patch or {}).items():
-            if k in self._PROTECTED_FIELDS:
-                continue
-            if isinstance(v, dict) and isinstance(out.get(k), dict):
-                out[k] = self._deep_merge(out[k], v)
-            else:
-                out[k] = v
+        if not patch:
+            return out
+
+        stack = [(out, patch)]
+        while stack:
+            dst, p = stack.pop()
+            for k, v in p.items():
+                if k in self._PROTECTED_FIELDS:
+                    continue
+                bv = dst.get(k)
+                if isinstance(v, dict) and isinstance(bv, dict):
+                    nd = dict(bv)
+                    dst[k] = nd
+                    stack.append((nd, v))
+                else:
+                    dst[k] = v
         return out
 
     def _direct_edit_portfolio_playbook(self):
@@ -297,7 +396,7 @@ class InvestmentAssistant:
         self.display.print_success("已保存总体 Playbook（直接更新）")
 
     def _direct_add_stock_playbook(self, stock_name: str):
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         current = self.storage.get_stock_playbook(stock_id) or {}
         if current:
             self.display.print_warning(f"已存在 {stock_name} 的 Playbook，将进入直接更新。")
@@ -324,7 +423,7 @@ class InvestmentAssistant:
         self.display.print_success(f"已保存 {stock_name} 的 Playbook（直接添加）")
 
     def _direct_edit_stock_playbook(self, stock_name: str):
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         current = self.storage.get_stock_playbook(stock_id)
         if not current:
             self.display.print_warning(f"未找到 {stock_name} 的 Playbook，将先创建。")
@@ -378,16 +477,14 @@ class InvestmentAssistant:
 
     def _show_stock_playbook(self, stock_name: str):
         """显示个股 Playbook"""
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         playbook = self.storage.get_stock_playbook(stock_id)
 
         if not playbook:
-            # 尝试模糊匹配
-            stocks = self.storage.list_stocks()
-            for s in stocks:
-                if stock_name.lower() in s["stock_name"].lower() or stock_name.lower() in s["stock_id"].lower():
-                    playbook = self.storage.get_stock_playbook(s["stock_id"])
-                    break
+            # 模糊匹配下沉到 Storage：目录名命中时一个 playbook 都不用加载
+            match_id = self.storage.find_stock(stock_name)
+            if match_id:
+                playbook = self.storage.get_stock_playbook(match_id)
 
         if playbook:
             self.display.playbook_panel(playbook, is_portfolio=False)
@@ -406,7 +503,7 @@ class InvestmentAssistant:
 
     def _start_update_stock_interview(self, stock_name: str):
         """开始更新个股 Playbook"""
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         current = self.storage.get_stock_playbook(stock_id)
         if current:
             self.current_mode = "stock_interview"
@@ -428,7 +525,7 @@ class InvestmentAssistant:
 
     def _delete_stock(self, stock_name: str):
         """删除股票"""
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         if self.display.confirm(f"确定要删除 {stock_name} 吗？"):
             if self.storage.delete_stock(stock_id):
                 self.display.print_success(f"已删除 {stock_name}")
@@ -437,7 +534,7 @@ class InvestmentAssistant:
 
     def _show_history(self, stock_name: str):
         """显示研究历史"""
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         history = self.storage.get_research_history(stock_id)
         records = history.get("records", [])
         self.display.history_table(records)
@@ -468,18 +565,19 @@ class InvestmentAssistant:
 
     def _handle_interview_input(self, user_input: str):
         """处理访谈输入"""
-        with self.display.spinner("思考中...") as progress:
-            progress.add_task("", total=None)
-
-            if self.current_mode == "portfolio_interview":
-                response, playbook = self.interview.continue_portfolio_interview(user_input)
-            elif self.current_mode == "stock_interview":
-                response, playbook = self.interview.continue_stock_interview(user_input, self.current_stock)
-            else:
-                return
-
-        # 显示响应
-        self.display.print(f"\n{response}\n")
+        # 流式渲染：首 token 到达即开始显示，而不是等完整响应再整段打印
+        self.display.print("")
+        if self.current_mode == "portfolio_interview":
+            response, playbook = self.interview.continue_portfolio_interview(
+                user_input, stream_callback=self.display.stream_write
+            )
+        elif self.current_mode == "stock_interview":
+            response, playbook = self.interview.continue_stock_interview(
+                user_input, self.current_stock, stream_callback=self.display.stream_write
+            )
+        else:
+            return
+        self.display.print("\n")
 
         if playbook:
             # 收到总结，询问确认
@@ -488,7 +586,7 @@ class InvestmentAssistant:
                     self.storage.save_portfolio_playbook(playbook)
                     self.display.print_success("已保存总体 Playbook")
                 else:
-                    stock_id = self.current_stock.lower().replace(" ", "_")
+                    stock_id = _stock_id(self.current_stock)
                     self.storage.save_stock_playbook(stock_id, playbook)
                     self.display.print_success(f"已保存 {self.current_stock} 的 Playbook")
                     self.display.print(f'输入 "{self.current_stock} 有新消息" 开始跟踪')
@@ -503,7 +601,7 @@ class InvestmentAssistant:
 
     def _start_environment_check(self, stock_name: str):
         """开始 Environment 检查"""
-        stock_id = stock_name.lower().replace(" ", "_")
+        stock_id = _stock_id(stock_name)
         playbook = self.storage.get_stock_playbook(stock_id)
 
         if not playbook:
@@ -531,32 +629,49 @@ class InvestmentAssistant:
 
         time_range = f"{time_range_days}d"
 
-        # 是否上传资料
-        user_uploaded = []
-        if self.display.confirm("是否有额外资料需要上传？", default=False):
-            while True:
-                file_path = self.display.input("请输入文件路径（支持 PDF、图片、文本，输入空行结束）: ").strip()
-                if not file_path:
-                    break
-                try:
-                    with self.display.spinner("正在处理文件...") as progress:
-                        progress.add_task("", total=None)
+        # 时间范围一确定，新闻采集就在后台线程启动：用户确认/上传资料的
+        # 这段"思考时间"全部用来掩盖搜索延迟，上传结束时新闻多半已就绪
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            news_future = executor.submit(
+                self.environment.collect_news, stock_id, stock_name, time_range_days
+            )
+
+            # 是否上传资料
+            # 文件分析同样是阻塞的 LLM 调用：提交到后台线程，用户输入下一个
+            # 路径时上一份文件已在分析中，总耗时从逐个串行降为与输入重叠
+            user_uploaded = []
+            if self.display.confirm("是否有额外资料需要上传？", default=False):
+                futures = []
+                while True:
+                    file_path = self.display.input("请输入文件路径（支持 PDF、图片、文本，输入空行结束）: ").strip()
+                    if not file_path:
+                        break
+                    try:
                         saved_path = self.storage.save_uploaded_file(stock_id, file_path)
-                        analysis = self.environment.analyze_file(saved_path)
+                    except Exception as e:
+                        self.display.print_error(f"处理文件失败: {e}")
+                        continue
+                    futures.append(executor.submit(self.environment.analyze_file, saved_path))
+
+                for future in futures:
+                    try:
+                        with self.display.spinner("正在处理文件...") as progress:
+                            progress.add_task("", total=None)
+                            analysis = future.result()
                         user_uploaded.append(analysis)
-                    self.display.print_success(f"已处理: {analysis['filename']}")
-                except Exception as e:
-                    self.display.print_error(f"处理文件失败: {e}")
-
-        # 采集新闻
-        auto_collected = []
-        with self.display.spinner(f"正在搜索过去 {time_range_days} 天的相关新闻...") as progress:
-            progress.add_task("", total=None)
-            news_result = self.environment.collect_news(stock_id, stock_name, time_range_days)
-            if isinstance(news_result, dict):
-                auto_collected = news_result.get("news", [])
-            else:
-                auto_collected = news_result if isinstance(news_result, list) else []
+                        self.display.print_success(f"已处理: {analysis['filename']}")
+                    except Exception as e:
+                        self.display.print_error(f"处理文件失败: {e}")
+
+            # 采集新闻（此时多半已在后台完成，result() 只是取回）
+            auto_collected = []
+            with self.display.spinner(f"正在搜索过去 {time_range_days} 天的相关新闻...") as progress:
+                progress.add_task("", total=None)
+                news_result = news_future.result()
+                if isinstance(news_result, dict):
+                    auto_collected = news_result.get("news", [])
+                else:
+                    auto_collected = news_result if isinstance(news_result, list) else []
 
         # 显示 Environment 摘要
         self.display.environment_panel(auto_collected, user_uploaded)
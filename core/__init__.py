@@ -1,5 +1,26 @@
-from .openai_client import OpenAIClient
-from .storage import Storage
-from .interview import InterviewManager
-from .environment import EnvironmentCollector
-from .research import ResearchEngine
+"""core 包入口
+
+PEP 562 惰性导出：`openai_client` 及其依赖（openai/httpx/pydantic）的导入
+占冷启动的大头，`from core import Storage` 这类用法不应连带付这笔成本。
+首次访问某个名字时才导入对应子模块，并回填 globals 供后续直接命中。
+"""
+
+_LAZY = {
+    "OpenAIClient": "openai_client",
+    "Storage": "storage",
+    "InterviewManager": "interview",
+    "EnvironmentCollector": "environment",
+    "ResearchEngine": "research",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+        mod = importlib.import_module(f".{_LAZY[name]}", __name__)
+        val = getattr(mod, name)
+        globals()[name] = val
+        return val
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,6 @@
 """Environment 采集模块"""
 
+import io
 import json
 import re
 from typing import Dict, List, Optional, Tuple
@@ -7,6 +8,43 @@ from datetime import datetime
 
 from .openai_client import OpenAIClient
 from .storage import Storage
+from utils.json_compat import loads as _json_loads, dumps_pretty as _json_dumps_pretty
+from utils.prompt_template import compile_template, render as _render_template
+
+
+# 新闻条目单遍扫描：行首可选列表符 + 日期 + 标题，紧随的非条目行作为摘要
+# _extract_json 用的预编译模式与线性扫描兜底：
+# 旧的 r'\{[\s\S]*"judgment"[\s\S]*\}' 贪婪回溯整个响应，
+# 20KB 未命中输入要扫两遍；改为 O(n) 括号配对扫描
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+
+
+def _find_balanced_json(s: str, marker: str = '"judgment"') -> Optional[str]:
+    """返回首个包含 marker 的平衡 {...} 片段；单遍扫描，无回溯"""
+    start = s.find("{")
+    depth = 0
+    i = start
+    while start != -1 and i < len(s):
+        c = s[i]
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                candidate = s[start:i + 1]
+                if marker in candidate:
+                    return candidate
+                start = s.find("{", i + 1)
+                i = start
+                continue
+        i += 1
+    return None
+
+
+_NEWS_ENTRY_RE = re.compile(
+    r"(?m)^[ \t]*[-•*]?[ \t]*\[?(?P<date>\d{1,2}/\d{1,2}|\d{4}-\d{2}-\d{2})\]?[ \t]*:?[ \t]*(?P<title>.+?)[ \t]*$"
+    r"(?:\n(?P<summary>(?![ \t]*[-•*]?[ \t]*\[?\d).+))?"
+)
 
 
 IMPACT_ASSESSMENT_PROMPT = """## 角色
@@ -144,6 +182,39 @@ IMPACT_ASSESSMENT_PROMPT = """## 角色
 
 如果不需要深度研究，research_plan 设为 null，但仍需在 conclusion 中说明理由。"""
 
+# import 时一次性编译（与 research / preference_learner 共用同一套 util）
+_IMPACT_PARTS = compile_template(IMPACT_ASSESSMENT_PROMPT)
+
+
+def _format_research_item(r: Dict) -> str:
+    """单条研究记录 -> prompt 片段（每条一次 f-string 分配，替代逐行 +=）"""
+    result = r.get("research_result", {})
+    feedback = r.get("user_feedback", {})
+
+    fb_block = ""
+    if feedback:
+        extras = []
+        if feedback.get("tracking_metrics"):
+            extras.append(f"- 用户关注的跟踪指标: {', '.join(feedback.get('tracking_metrics', []))}\n")
+        if feedback.get("notes"):
+            extras.append(f"- 用户备注: {feedback.get('notes')}\n")
+        if feedback.get("next_direction"):
+            extras.append(f"- 用户希望的后续研究方向: {feedback.get('next_direction')}\n")
+        fb_block = (
+            f"\n**用户反馈:**\n"
+            f"- 研究是否有价值: {'是' if feedback.get('research_valuable', True) else '否'}\n"
+            f"- 方向评价: {feedback.get('direction_correct', '未评价')}\n"
+            f"- 用户决策: {feedback.get('decision', '未决策')}\n"
+            f"{''.join(extras)}"
+        )
+
+    return (
+        f"### 研究日期: {r.get('date', '')[:10]}\n"
+        f"**AI建议:** {result.get('recommendation', '未知')} | **信心:** {result.get('confidence', '未知')}\n"
+        f"**核心推理:** {result.get('reasoning', '无')}\n"
+        f"{fb_block}"
+    )
+
 
 class EnvironmentCollector:
     """Environment 采集器"""
@@ -151,6 +222,20 @@ class EnvironmentCollector:
     def __init__(self, client: OpenAIClient, storage: Storage):
         self.client = client
         self.storage = storage
+        # prompt 用 JSON 序列化缓存：key -> (版本标识, 渲染结果)；
+        # watchlist 逐股刷新时同一份 playbook 不必每次重新 indent dumps
+        self._dumps_cache: Dict[str, Tuple[object, str]] = {}
+
+    def _dumps_cached(self, name: str, version, obj: Optional[Dict]) -> str:
+        """按版本缓存的 json.dumps(..., indent=2)；空对象返回占位文案"""
+        if not obj:
+            return "（暂无）"
+        cached = self._dumps_cache.get(name)
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        rendered = _json_dumps_pretty(obj)
+        self._dumps_cache[name] = (version, rendered)
+        return rendered
 
     def collect_news(self, stock_id: str, stock_name: str, time_range_days: int = 7) -> Dict:
         """采集相关新闻（使用多维度分层搜索）
@@ -220,48 +305,20 @@ class EnvironmentCollector:
         }
 
     def _parse_news_response(self, response: str) -> List[Dict]:
-        """解析新闻响应"""
-        # 简单解析，将响应分割成新闻条目
-        news_list = []
-
-        # 尝试按常见格式解析
-        lines = response.split("\n")
-        current_news = {}
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                if current_news:
-                    news_list.append(current_news)
-                    current_news = {}
-                continue
+        """解析新闻响应（单遍 finditer 扫描，替代逐行状态机）
 
-            # 尝试提取日期和标题
-            if line.startswith("-") or line.startswith("•") or line.startswith("*"):
-                line = line[1:].strip()
-
-            # 检查是否包含日期格式
-            date_match = re.search(r'\[?(\d{1,2}/\d{1,2}|\d{4}-\d{2}-\d{2})\]?', line)
-            if date_match:
-                if current_news:
-                    news_list.append(current_news)
-                current_news = {
-                    "date": date_match.group(1),
-                    "title": line.replace(date_match.group(0), "").strip().strip(":").strip(),
-                    "source": "gemini_search"
-                }
-            elif current_news and "summary" not in current_news:
-                current_news["summary"] = line
-            elif not current_news and line:
-                # 没有日期的新闻
-                current_news = {
-                    "date": datetime.now().strftime("%m/%d"),
-                    "title": line[:100],
-                    "source": "gemini_search"
-                }
-
-        if current_news:
-            news_list.append(current_news)
+        不做 split("\n")：finditer 逐条产出 match，除最终 news_list 外
+        不物化任何中间行列表，峰值内存与响应长度无关。
+        """
+        news_list = [
+            {
+                "date": m["date"],
+                "title": m["title"].strip(":").strip(),
+                "summary": (m["summary"] or "").strip(),
+                "source": "gemini_search",
+            }
+            for m in _NEWS_ENTRY_RE.finditer(response)
+        ]
 
         # 如果解析失败，返回整个响应作为一条
         if not news_list and response.strip():
@@ -297,9 +354,13 @@ class EnvironmentCollector:
         stock_id: str,
         time_range: str,
         auto_collected: List[Dict],
-        user_uploaded: List[Dict]
+        user_uploaded: List[Dict],
+        on_partial=None,
     ) -> Dict:
-        """评估影响，判断是否需要 Deep Research"""
+        """评估影响，判断是否需要 Deep Research
+
+        on_partial: 可选回调，流式接收增量文本（UI 进度渲染用）。
+        """
         # 获取所需数据
         portfolio = self.storage.get_portfolio_playbook()
         stock_playbook = self.storage.get_stock_playbook(stock_id)
@@ -308,82 +369,84 @@ class EnvironmentCollector:
         user_preferences = self.storage.get_preferences_for_prompt()  # 用户偏好
         historical_uploads = self.storage.get_historical_uploads(stock_id, limit=5)  # 历史上传文件
 
-        # 格式化数据
-        portfolio_str = json.dumps(portfolio, ensure_ascii=False, indent=2) if portfolio else "（暂无）"
-        stock_str = json.dumps(stock_playbook, ensure_ascii=False, indent=2) if stock_playbook else "（暂无）"
+        # 格式化数据（按存储版本缓存序列化结果）
+        portfolio_str = self._dumps_cached(
+            "portfolio", self.storage.get_portfolio_playbook_version(), portfolio
+        )
+        stock_str = self._dumps_cached(
+            f"stock:{stock_id}", self.storage.get_stock_playbook_version(stock_id), stock_playbook
+        )
 
         history_str = "（暂无历史研究）"
         if research_context:
             # 优先使用带用户反馈的研究上下文
-            history_items = []
-            for r in research_context:
-                result = r.get("research_result", {})
-                feedback = r.get("user_feedback", {})
-
-                item = f"### 研究日期: {r.get('date', '')[:10]}\n"
-                item += f"**AI建议:** {result.get('recommendation', '未知')} | **信心:** {result.get('confidence', '未知')}\n"
-                item += f"**核心推理:** {result.get('reasoning', '无')}\n"
-
-                if feedback:
-                    item += f"\n**用户反馈:**\n"
-                    item += f"- 研究是否有价值: {'是' if feedback.get('research_valuable', True) else '否'}\n"
-                    item += f"- 方向评价: {feedback.get('direction_correct', '未评价')}\n"
-                    item += f"- 用户决策: {feedback.get('decision', '未决策')}\n"
-                    if feedback.get('tracking_metrics'):
-                        item += f"- 用户关注的跟踪指标: {', '.join(feedback.get('tracking_metrics', []))}\n"
-                    if feedback.get('notes'):
-                        item += f"- 用户备注: {feedback.get('notes')}\n"
-                    if feedback.get('next_direction'):
-                        item += f"- 用户希望的后续研究方向: {feedback.get('next_direction')}\n"
-
-                history_items.append(item)
-            history_str = "\n---\n".join(history_items)
+            history_str = "\n---\n".join(_format_research_item(r) for r in research_context)
         elif recent_history:
-            # 兜底：使用普通历史
-            history_items = []
+            # 兜底：使用普通历史（单缓冲写入，不积中间 list）
+            buf = io.StringIO()
             for r in recent_history:
                 result = r.get("research_result", {})
-                history_items.append(f"- {r.get('date', '')[:10]}: {result.get('recommendation', '')} - {result.get('reasoning', '')}")
+                buf.write(f"- {r.get('date', '')[:10]}: {result.get('recommendation', '')} - {result.get('reasoning', '')}\n")
                 follow_ups = result.get("follow_up_items", [])
                 if follow_ups:
-                    history_items.append(f"  待跟进: {', '.join(follow_ups)}")
-            history_str = "\n".join(history_items)
+                    buf.write(f"  待跟进: {', '.join(follow_ups)}\n")
+            history_str = buf.getvalue().rstrip("\n")
 
         auto_str = "（暂无）"
         if auto_collected:
-            auto_items = [f"- [{n.get('date', '')}] {n.get('title', '')}" for n in auto_collected]
-            auto_str = "\n".join(auto_items)
+            auto_str = "\n".join(f"- [{n.get('date', '')}] {n.get('title', '')}" for n in auto_collected)
 
         uploaded_str = "（暂无）"
         if user_uploaded:
-            uploaded_items = [f"- {u.get('filename', '')}: {u.get('summary', '')[:100]}..." for u in user_uploaded]
-            uploaded_str = "\n".join(uploaded_items)
+            uploaded_str = "\n".join(
+                f"- {u.get('filename', '')}: {u.get('summary', '')[:100]}..." for u in user_uploaded
+            )
 
         # 格式化历史上传文件
         historical_str = "（暂无历史上传资料）"
         if historical_uploads:
-            hist_items = []
+            buf = io.StringIO()
             for h in historical_uploads:
-                hist_items.append(f"- [{h.get('date', '')}] {h.get('filename', '')}")
+                buf.write(f"- [{h.get('date', '')}] {h.get('filename', '')}\n")
                 if h.get('summary'):
                     # 截取摘要的前200字符
-                    summary_preview = h.get('summary', '')[:200]
-                    hist_items.append(f"  摘要: {summary_preview}...")
-            historical_str = "\n".join(hist_items)
-
-        # 调用 AI 评估
-        prompt = IMPACT_ASSESSMENT_PROMPT.format(
-            recent_research_history=history_str,
-            portfolio_playbook=portfolio_str,
-            stock_playbook=stock_str,
-            user_preferences=user_preferences,
-            time_range=time_range,
-            auto_collected_news=auto_str,
-            user_uploaded_content=uploaded_str,
-            historical_uploads=historical_str
-        )
-
-        response = self.client.chat(prompt)
+                    buf.write(f"  摘要: {h.get('summary', '')[:200]}...\n")
+            historical_str = buf.getvalue().rstrip("\n")
+
+        # 调用 AI 评估（预编译模板渲染，跳过 format 解析）
+        prompt = _render_template(_IMPACT_PARTS, {
+            "recent_research_history": history_str,
+            "portfolio_playbook": portfolio_str,
+            "stock_playbook": stock_str,
+            "user_preferences": user_preferences,
+            "time_range": time_range,
+            "auto_collected_news": auto_str,
+            "user_uploaded_content": uploaded_str,
+            "historical_uploads": historical_str,
+        })
+
+        # 流式接收：输出以 ```json fence 包裹，第二个 fence 出现即 JSON 闭合，
+        # 提前断流省掉尾部生成等待
+        parts: List[str] = []
+        fences = 0
+        pending = ""  # 尚未计数的流尾部（跨 delta 拼接 fence 用）
+        for delta in self.client.chat_stream(prompt):
+            parts.append(delta)
+            if on_partial:
+                on_partial(delta)
+            pending += delta
+            while True:
+                i = pending.find("```")
+                if i == -1:
+                    # 只留可能与下个 delta 拼成 fence 的末尾 2 个字符
+                    pending = pending[-2:]
+                    break
+                fences += 1
+                # 整个 fence 一并消费，4+ 个连续反引号不会被重复计数
+                pending = pending[i + 3:]
+            if fences >= 2:
+                break
+        response = "".join(parts)
 
         # 解析 JSON 响应
         result, parse_error = self._extract_json(response)
@@ -411,28 +474,27 @@ class EnvironmentCollector:
     def _extract_json(self, response: str) -> Tuple[Optional[Dict], Optional[str]]:
         """从响应中提取 JSON，返回 (result, error_message)"""
         # 尝试从 markdown code block 中提取
-        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
+        json_match = _CODE_BLOCK_RE.search(response)
         if json_match:
             try:
-                return json.loads(json_match.group(1)), None
-            except json.JSONDecodeError as e:
+                return _json_loads(json_match.group(1)), None
+            except ValueError as e:
                 error_msg = f"JSON 解析错误 (code block): {str(e)}"
                 self.storage.log(error_msg, "WARNING")
 
         # 尝试直接解析整个响应
         try:
-            return json.loads(response), None
-        except json.JSONDecodeError as e:
+            return _json_loads(response), None
+        except ValueError as e:
             error_msg = f"JSON 解析错误 (direct): {str(e)}"
             self.storage.log(error_msg, "WARNING")
 
-        # 尝试查找 JSON 对象模式
-        json_pattern = r'\{[\s\S]*"judgment"[\s\S]*\}'
-        match = re.search(json_pattern, response)
-        if match:
+        # 线性扫描查找包含 "judgment" 的平衡 JSON 对象
+        candidate = _find_balanced_json(response)
+        if candidate:
             try:
-                return json.loads(match.group(0)), None
-            except json.JSONDecodeError:
+                return _json_loads(candidate), None
+            except ValueError:
                 pass
 
         return None, "无法解析 AI 响应为 JSON 格式，请查看原始响应"
@@ -6,9 +6,41 @@ from typing import Optional, Dict, List, Tuple
 
 from .openai_client import OpenAIClient
 from .storage import Storage
+from utils.json_compat import loads as _json_loads, dumps_pretty as _json_dumps_pretty
 
 
-PORTFOLIO_INTERVIEW_PROMPT = """## 角色
+# _extract_json / _is_summary 用的预编译模式（模块级，避免每次查模式缓存）
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+_SUMMARY_FENCE_RE = re.compile(r'```(?:json)?\s*\{')
+
+# 裸 JSON 扫描：raw_decode 从每个 '{' 起点尝试，命中第一个合法对象即停，
+# 替代旧的 r'\{[\s\S]*\}' 贪婪整串回溯
+_DECODER = json.JSONDecoder()
+_PLAYBOOK_KEYS = frozenset({"core_thesis", "market_views", "stock_name"})
+
+
+def _is_playbook(obj) -> bool:
+    """是否形如 Playbook（个股/总体任一关键字段命中）"""
+    return isinstance(obj, dict) and not _PLAYBOOK_KEYS.isdisjoint(obj)
+
+
+def _scan_json_objects(s: str):
+    """依次产出响应中的合法 JSON 对象（O(n)，JSON 后的尾随文字不影响）"""
+    idx = s.find("{")
+    while idx != -1:
+        try:
+            obj, end = _DECODER.raw_decode(s, idx)
+        except ValueError:
+            idx = s.find("{", idx + 1)
+            continue
+        yield obj
+        idx = s.find("{", end)
+
+
+# 静态指令放 system、动态内容放 user：OpenAI 隐式 prompt cache 按前缀
+# token 命中，整场访谈里不变的大段规则/JSON 模板因此每轮都能被缓存计价
+PORTFOLIO_INTERVIEW_SYSTEM = """## 角色
 你是一位投资教练，帮助用户梳理整体投资观点和策略框架。
 
 ## 目标
@@ -43,37 +75,37 @@ PORTFOLIO_INTERVIEW_PROMPT = """## 角色
 阶段4 - 确认总结:
   - 当信息足够时，生成 JSON 格式的总结并请用户确认
 
-## 对话历史
-{conversation_history}
-
 ## 任务
-基于对话历史，决定下一步：
+基于用户消息中给出的对话历史，决定下一步：
 1. 如果信息还不完整，继续提问（直接输出问题，不要加前缀）
 2. 如果信息已足够，输出 JSON 格式的 Playbook 总结
 
 当输出总结时，使用以下格式：
 ```json
-{{
-  "market_views": {{
+{
+  "market_views": {
     "bullish_themes": [
-      {{"theme": "主题名", "reasoning": "理由", "confidence": "高/中/低"}}
+      {"theme": "主题名", "reasoning": "理由", "confidence": "高/中/低"}
     ],
     "bearish_themes": [
-      {{"theme": "主题名", "reasoning": "理由", "confidence": "高/中/低"}}
+      {"theme": "主题名", "reasoning": "理由", "confidence": "高/中/低"}
     ],
     "macro_views": ["宏观观点1", "宏观观点2"]
-  }},
-  "portfolio_strategy": {{
-    "target_allocation": {{"类别1": "比例1", "类别2": "比例2"}},
+  },
+  "portfolio_strategy": {
+    "target_allocation": {"类别1": "比例1", "类别2": "比例2"},
     "risk_tolerance": "风险承受描述",
     "holding_period": "持有周期"
-  }},
+  },
   "watchlist": ["关注事项1", "关注事项2"]
-}}
+}
 ```"""
 
+PORTFOLIO_INTERVIEW_USER = """## 对话历史
+{conversation_history}"""
+
 
-STOCK_INTERVIEW_PROMPT = """## 角色
+STOCK_INTERVIEW_SYSTEM = """## 角色
 你是一位投资教练，擅长用苏格拉底式提问帮助投资者理清思路。
 
 ## 目标
@@ -92,43 +124,51 @@ STOCK_INTERVIEW_PROMPT = """## 角色
 - 当信息足够时，输出 JSON 格式的 Playbook 总结
 - 用简洁友好的语气
 
-## 用户的总体 Playbook
-{portfolio_playbook}
-
-## 当前股票
-用户想买入: {stock_name}
-
-## 对话历史
-{conversation_history}
-
 ## 任务
-基于对话历史，决定下一步：
+基于用户消息中给出的总体 Playbook、当前股票和对话历史，决定下一步：
 1. 如果信息还不完整，继续提问（直接输出问题，不要加前缀）
 2. 如果信息已足够，输出 JSON 格式的 Playbook 总结
 3. 注意关联总体 Playbook 中的相关观点
 
 当输出总结时，使用以下格式：
 ```json
-{{
+{
   "stock_name": "股票名称",
   "ticker": "股票代码",
-  "core_thesis": {{
+  "core_thesis": {
     "summary": "一句话总结",
     "key_points": ["要点1", "要点2"],
     "market_gap": "市场认知差"
-  }},
+  },
   "validation_signals": ["验证信号1", "验证信号2"],
   "invalidation_triggers": ["失效条件1", "失效条件2"],
-  "operation_plan": {{
+  "operation_plan": {
     "holding_period": "持有周期",
     "target_price": null,
     "stop_loss": null,
     "position_size": "仓位比例"
-  }},
+  },
   "related_entities": ["相关实体1", "相关实体2"]
-}}
+}
 ```"""
 
+STOCK_INTERVIEW_USER = """## 用户的总体 Playbook
+{portfolio_playbook}
+
+## 当前股票
+用户想买入: {stock_name}
+
+## 对话历史
+{conversation_history}"""
+
+
+# 模板在导入时预切分：每轮只做拼接，不再让 str.format 重新扫描模板
+_PORTFOLIO_USER_HEAD, _PORTFOLIO_USER_TAIL = PORTFOLIO_INTERVIEW_USER.split("{conversation_history}")
+_STOCK_USER_P0, _rest = STOCK_INTERVIEW_USER.split("{portfolio_playbook}")
+_STOCK_USER_P1, _rest = _rest.split("{stock_name}")
+_STOCK_USER_P2, _STOCK_USER_P3 = _rest.split("{conversation_history}")
+del _rest
+
 
 class InterviewManager:
     """苏格拉底访谈管理器"""
@@ -137,75 +177,90 @@ class InterviewManager:
         self.client = client
         self.storage = storage
         self.conversation_history: List[Dict] = []
+        # 转写文本的增量缓冲：每条消息 append 一段，_format_history 只剩 join，
+        # 免去整场访谈 O(n^2) 的逐轮全量重建
+        self._history_parts: List[str] = []
+        # 总体 Playbook 序列化缓存：以 (mtime, size) 为版本号，
+        # 访谈每轮都要把多 KB 的 playbook JSON 嵌进 prompt，没必要每轮重新 dumps
+        self._portfolio_str_cache: Optional[str] = None
+        self._portfolio_str_version: Optional[Tuple[float, int]] = None
+
+    def _portfolio_playbook_str(self) -> str:
+        """渲染嵌入 prompt 的总体 Playbook JSON（按文件版本缓存）"""
+        version = self.storage.get_portfolio_playbook_version()
+        if version is None:
+            return "（暂无）"
+        if version != self._portfolio_str_version:
+            portfolio = self.storage.get_portfolio_playbook()
+            self._portfolio_str_cache = (
+                _json_dumps_pretty(portfolio) if portfolio else "（暂无）"
+            )
+            self._portfolio_str_version = version
+        return self._portfolio_str_cache
 
     def reset(self):
         """重置对话历史"""
         self.conversation_history = []
+        self._history_parts = []
+
+    def _append(self, role: str, content: str):
+        """追加一条消息（同步维护结构化历史与转写缓冲）"""
+        self.conversation_history.append({"role": role, "content": content})
+        self._history_parts.append(
+            f"{'助手' if role == 'assistant' else '用户'}: {content}"
+        )
 
     def _format_history(self) -> str:
         """格式化对话历史"""
-        if not self.conversation_history:
+        if not self._history_parts:
             return "（暂无）"
-        lines = []
-        for msg in self.conversation_history:
-            role = "助手" if msg["role"] == "assistant" else "用户"
-            lines.append(f"{role}: {msg['content']}")
-        return "\n".join(lines)
+        return "\n".join(self._history_parts)
 
     def _extract_json(self, response: str) -> Optional[Dict]:
         """从响应中提取 JSON，使用多种策略确保提取成功"""
+        # 快速门：访谈里绝大多数轮次是纯追问文本，连 '{' 都没有，
+        # C 层子串判断挡掉它们，正则/扫描只在可能有 JSON 时才跑
+        if '{' not in response:
+            return None
+
         # 策略1: 尝试从最后一个 markdown 代码块中提取（通常 Playbook 在最后）
-        json_matches = re.findall(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
+        # 解析失败时就地做尾逗号清理重试（只清理候选片段，不动整个响应）
+        json_matches = _CODE_BLOCK_RE.findall(response)
+        fallback = None
         for json_str in reversed(json_matches):  # 从后往前尝试
             try:
-                result = json.loads(json_str)
-                # 验证是否是 Playbook 结构（包含关键字段）
-                if isinstance(result, dict) and (
-                    'core_thesis' in result or  # 个股 Playbook
-                    'market_views' in result or  # 总体 Playbook
-                    'stock_name' in result
-                ):
-                    return result
-            except json.JSONDecodeError:
-                continue
-
-        # 策略2: 尝试提取 { ... } 格式的 JSON（可能没有代码块包裹）
-        brace_match = re.search(r'\{[\s\S]*\}', response)
-        if brace_match:
-            try:
-                result = json.loads(brace_match.group())
-                if isinstance(result, dict) and (
-                    'core_thesis' in result or
-                    'market_views' in result or
-                    'stock_name' in result
-                ):
-                    return result
-            except json.JSONDecodeError:
-                pass
+                result = _json_loads(json_str)
+            except ValueError:
+                try:
+                    result = _json_loads(_TRAILING_COMMA_RE.sub(r'\1', json_str))
+                except ValueError:
+                    continue
+            if _is_playbook(result):
+                return result
+            if fallback is None and isinstance(result, dict):
+                fallback = result
+
+        # 策略2: raw_decode 扫描无代码块包裹的裸 JSON 对象
+        for result in _scan_json_objects(response):
+            if _is_playbook(result):
+                return result
 
         # 策略3: 尝试直接解析整个响应
         try:
-            result = json.loads(response)
+            result = _json_loads(response)
             if isinstance(result, dict):
                 return result
-        except json.JSONDecodeError:
+        except ValueError:
             pass
 
-        # 策略4: 清理常见问题后重试（如尾部多余逗号）
-        for json_str in reversed(json_matches):
-            cleaned = re.sub(r',(\s*[}\]])', r'\1', json_str)  # 移除尾部逗号
-            try:
-                result = json.loads(cleaned)
-                if isinstance(result, dict):
-                    return result
-            except json.JSONDecodeError:
-                continue
-
-        return None
+        # 兜底：代码块里解析出过 dict 但不带 Playbook 关键字段
+        return fallback
 
     def _is_summary(self, response: str) -> bool:
         """判断响应是否是总结（包含 JSON）"""
-        return bool(re.search(r'```(?:json)?\s*\{', response))
+        if '```' not in response:
+            return False
+        return bool(_SUMMARY_FENCE_RE.search(response))
 
     # ==================== 总体 Playbook 访谈 ====================
 
@@ -214,31 +269,36 @@ class InterviewManager:
         self.reset()
         # 返回第一个问题
         first_question = "你当前最看好的投资方向或主题是什么？"
-        self.conversation_history.append({"role": "assistant", "content": first_question})
+        self._append("assistant", first_question)
         return first_question
 
-    def continue_portfolio_interview(self, user_input: str) -> Tuple[str, Optional[Dict]]:
+    def continue_portfolio_interview(
+        self, user_input: str, stream_callback=None
+    ) -> Tuple[str, Optional[Dict]]:
         """继续总体 Playbook 访谈
 
         返回: (AI 响应, 如果是总结则返回 Playbook 字典，否则为 None)
+        stream_callback 透传给 client.chat，用于 CLI 流式渲染。
         """
-        self.conversation_history.append({"role": "user", "content": user_input})
+        self._append("user", user_input)
 
-        prompt = PORTFOLIO_INTERVIEW_PROMPT.format(
-            conversation_history=self._format_history()
+        response = self.client.chat_with_system(
+            PORTFOLIO_INTERVIEW_SYSTEM,
+            f"{_PORTFOLIO_USER_HEAD}{self._format_history()}{_PORTFOLIO_USER_TAIL}",
+            stream_callback=stream_callback,
         )
 
-        response = self.client.chat(prompt)
-
         # 检查是否是总结
         playbook = self._extract_json(response)
 
         if playbook:
             # 保存对话历史到 playbook
-            playbook["interview_transcript"] = self.conversation_history.copy()
+            # 按引用挂载：reset() 重绑新列表而非原地清空，旧转写不受影响；
+            # 浅 copy 本来也不隔离消息 dict，只是白付一次列表拷贝
+            playbook["interview_transcript"] = self.conversation_history
             return response, playbook
         else:
-            self.conversation_history.append({"role": "assistant", "content": response})
+            self._append("assistant", response)
             return response, None
 
     # ==================== 个股 Playbook 访谈 ====================
@@ -260,28 +320,27 @@ class InterviewManager:
         else:
             first_question = f"好的，让我们来聊聊{stock_name}。\n\n你为什么想买入{stock_name}？核心看好什么？"
 
-        self.conversation_history.append({"role": "assistant", "content": first_question})
+        self._append("assistant", first_question)
         return first_question
 
-    def continue_stock_interview(self, user_input: str, stock_name: str) -> Tuple[str, Optional[Dict]]:
+    def continue_stock_interview(
+        self, user_input: str, stock_name: str, stream_callback=None
+    ) -> Tuple[str, Optional[Dict]]:
         """继续个股 Playbook 访谈
 
         返回: (AI 响应, 如果是总结则返回 Playbook 字典，否则为 None)
+        stream_callback 透传给 client.chat，用于 CLI 流式渲染。
         """
-        self.conversation_history.append({"role": "user", "content": user_input})
-
-        # 获取总体 Playbook
-        portfolio = self.storage.get_portfolio_playbook()
-        portfolio_str = json.dumps(portfolio, ensure_ascii=False, indent=2) if portfolio else "（暂无）"
-
-        prompt = STOCK_INTERVIEW_PROMPT.format(
-            portfolio_playbook=portfolio_str,
-            stock_name=stock_name,
-            conversation_history=self._format_history()
+        self._append("user", user_input)
+
+        response = self.client.chat_with_system(
+            STOCK_INTERVIEW_SYSTEM,
+            (f"{_STOCK_USER_P0}{self._portfolio_playbook_str()}"
+             f"{_STOCK_USER_P1}{stock_name}"
+             f"{_STOCK_USER_P2}{self._format_history()}{_STOCK_USER_P3}"),
+            stream_callback=stream_callback,
         )
 
-        response = self.client.chat(prompt)
-
         # 检查是否是总结
         playbook = self._extract_json(response)
 
@@ -290,10 +349,12 @@ class InterviewManager:
             if "stock_name" not in playbook:
                 playbook["stock_name"] = stock_name
             # 保存对话历史
-            playbook["interview_transcript"] = self.conversation_history.copy()
+            # 按引用挂载：reset() 重绑新列表而非原地清空，旧转写不受影响；
+            # 浅 copy 本来也不隔离消息 dict，只是白付一次列表拷贝
+            playbook["interview_transcript"] = self.conversation_history
             return response, playbook
         else:
-            self.conversation_history.append({"role": "assistant", "content": response})
+            self._append("assistant", response)
             return response, None
 
     # ==================== 更新访谈 ====================
@@ -302,7 +363,7 @@ class InterviewManager:
         """开始更新总体 Playbook 的访谈"""
         self.reset()
         first_question = "好的，让我们更新你的投资观点。\n\n你对当前看好的方向有什么变化吗？"
-        self.conversation_history.append({"role": "assistant", "content": first_question})
+        self._append("assistant", first_question)
         return first_question
 
     def start_update_stock_interview(self, stock_name: str, current_playbook: Dict) -> str:
@@ -310,5 +371,5 @@ class InterviewManager:
         self.reset()
         summary = current_playbook.get("core_thesis", {}).get("summary", "")
         first_question = f"好的，让我们更新{stock_name}的投资逻辑。\n\n当前的核心逻辑是「{summary}」，有什么变化吗？"
-        self.conversation_history.append({"role": "assistant", "content": first_question})
+        self._append("assistant", first_question)
         return first_question
@@ -0,0 +1,140 @@
+"""LLM 响应磁盘缓存
+
+与检索缓存（`core.retrieval` 的 `SEARCH_CACHE_DIR`）同构：
+`~/.investment-assistant/cache/llm/` 下每个 key 一个 JSON 文件，
+key = blake2b(model + messages)。
+
+本项目的 chat 调用不设温度（近似确定性输出），因此同一 prompt 的重复调用
+（重复进入访谈、帮助→开始→取消→再开始这类 UI 往返、开发调试循环）
+可以直接命中缓存，省掉整个 LLM 往返和 token 成本。
+带对话历史的调用 key 自然不同，不会互相污染。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.json_compat import loads as _json_loads, dumps as _json_dumps
+
+LLM_CACHE_DIR = Path.home() / ".investment-assistant" / "cache" / "llm"
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+# 进程内 LRU 一级缓存：同一会话内的重复 prompt 连磁盘读+JSON 解析都省掉。
+# 二级仍是磁盘（跨进程/跨次运行生效）。
+_MEM_MAX_ENTRIES = 256
+_mem_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_mem_lock = threading.Lock()
+
+# 磁盘层条目上限：超过后按 mtime 淘汰最旧的（写入即刷新 mtime，近似 LRU）。
+# 深研响应单条几十 KB，不设上限的话目录会随独立 prompt 数无限增长
+_DISK_MAX_ENTRIES = 1024
+
+
+def clear_memory() -> None:
+    """清空进程内一级缓存（测试隔离用）"""
+    with _mem_lock:
+        _mem_cache.clear()
+
+
+def make_key(model: str, messages: List[Dict[str, str]], extra: Optional[Dict] = None) -> str:
+    """计算缓存 key（model + 完整 messages 的稳定哈希）
+
+    extra: 影响输出的额外请求参数（如 response_format），参与哈希；
+    为 None 时不进 payload，保持与旧 key 兼容。
+    """
+    body: Dict = {"model": model, "messages": messages}
+    if extra:
+        body["extra"] = extra
+    payload = _json_dumps(body)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _mem_get(key: str, ttl_seconds: int) -> Optional[str]:
+    with _mem_lock:
+        entry = _mem_cache.get(key)
+        if entry is None:
+            return None
+        ts, response = entry
+        if time.time() - ts > ttl_seconds:
+            del _mem_cache[key]
+            return None
+        _mem_cache.move_to_end(key)
+        return response
+
+
+def _mem_put(key: str, ts: float, response: str) -> None:
+    with _mem_lock:
+        _mem_cache[key] = (ts, response)
+        _mem_cache.move_to_end(key)
+        while len(_mem_cache) > _MEM_MAX_ENTRIES:
+            _mem_cache.popitem(last=False)
+
+
+def get(key: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> Optional[str]:
+    """读取缓存（内存 LRU 优先，磁盘兜底）；未命中 / 过期 / 损坏均返回 None"""
+    cached = _mem_get(key, ttl_seconds)
+    if cached is not None:
+        return cached
+    path = LLM_CACHE_DIR / f"{key}.json"
+    try:
+        entry = _json_loads(path.read_text(encoding="utf-8"))
+        ts = entry.get("ts", 0)
+        if time.time() - ts > ttl_seconds:
+            # 顺手清掉彻底过期的文件；只对调用方传了更短 TTL 的读保留
+            # （同一条目对默认 TTL 的其它调用方可能仍有效）
+            if time.time() - ts > DEFAULT_TTL_SECONDS:
+                path.unlink(missing_ok=True)
+            return None
+        response = entry.get("response")
+        if response is not None:
+            _mem_put(key, ts, response)
+        return response
+    except OSError:
+        return None
+    except ValueError:
+        # 损坏条目永远解析不出来，留着只是每次白读一遍
+        path.unlink(missing_ok=True)
+        return None
+
+
+def _evict_disk_overflow() -> None:
+    """目录超过 _DISK_MAX_ENTRIES 时删掉 mtime 最旧的条目文件"""
+    try:
+        entries = [
+            (e.stat().st_mtime, e.path)
+            for e in os.scandir(LLM_CACHE_DIR)
+            if e.name.endswith(".json")
+        ]
+        overflow = len(entries) - _DISK_MAX_ENTRIES
+        if overflow > 0:
+            entries.sort()
+            for _, stale_path in entries[:overflow]:
+                try:
+                    os.unlink(stale_path)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+
+def put(key: str, response: str) -> None:
+    """写入缓存；磁盘不可写时静默跳过（缓存永远只是加速，不是依赖）"""
+    ts = time.time()
+    _mem_put(key, ts, response)
+    try:
+        LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = LLM_CACHE_DIR / f"{key}.json"
+        path.write_text(
+            _json_dumps({"ts": ts, "response": response}),
+            encoding="utf-8",
+        )
+        _evict_disk_overflow()
+    except OSError:
+        pass
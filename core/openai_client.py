@@ -10,24 +10,176 @@
 
 from __future__ import annotations
 
+import hashlib
+import heapq
 import json
 import logging
+import math
 import os
 import re
-import urllib.parse
-import urllib.request
-import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from datetime import datetime, timedelta
-from email.utils import parsedate_to_datetime
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Callable, Iterator, Optional, List, Dict, Any, Tuple
 
-try:
-    from openai import OpenAI
-except ImportError as e:
-    raise ImportError("请先安装 openai: pip install openai") from e
+# base64/mmap（仅 analyze_file）、urllib/ElementTree/email.utils（仅 RSS 兜底）
+# 推迟到对应方法内导入：CLI 冷启动的主路径用不到它们
+
+# openai/httpx 推迟到 OpenAIClient.__init__ 按需导入：import core.openai_client
+# 本身不再付 SDK 的导入开销（CLI 子命令里有完全不走 LLM 的路径）。
+# 保留模块级名字是为了可替换性（测试里 patch("core.openai_client.OpenAI")）。
+OpenAI = None  # type: ignore[assignment]
+httpx = None  # type: ignore[assignment]
+
+from . import llm_cache
+from utils.json_compat import loads as _json_loads
 
 logger = logging.getLogger(__name__)
 
+# 历史消息角色归一（gemini 的 "model" -> openai 的 "assistant"）
+_ROLE_MAP = {"assistant": "assistant", "model": "assistant"}
+
+
+def _normalize_history(history: Optional[List[Dict]]) -> List[Dict[str, str]]:
+    """对话历史 -> OpenAI messages 片段（单次查表，无分支）"""
+    if not history:
+        return []
+    return [
+        {"role": _ROLE_MAP.get(m.get("role"), "user"), "content": m.get("content", "")}
+        for m in history
+    ]
+
+
+# 结构化新闻响应里的 JSON 对象（首个 { 到最后一个 }）
+_BRACE_SPAN_RE = re.compile(r'\{[\s\S]*\}')
+
+# analyze_file 的后缀分发表：查表替代 if/elif 级联
+_TEXT_EXT = frozenset({".txt", ".md", ".csv", ".json", ".log"})
+_MIME_MAP = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+# 超过此大小走 Files API 流式上传，避免整文件读进进程内存
+_UPLOAD_THRESHOLD_BYTES = 20 * 1024 * 1024
+
+# importance 排序权重（去重冲突时也按它取优）
+_IMP_RANK = {"高": 0, "中": 1, "低": 2}
+
+
+def _simhash64(text: str) -> int:
+    """64 位 SimHash（CJK 友好：字符 3-gram shingle）
+
+    不同媒体报道同一事件时标题只差几个字，精确前缀匹配抓不住；
+    SimHash 指纹间的 Hamming 距离近似标题相似度。
+    """
+    shingles = [text[i:i + 3] for i in range(len(text) - 2)] if len(text) >= 3 else [text]
+    weights = [0] * 64
+    for sh in shingles:
+        h = int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            if (h >> bit) & 1:
+                weights[bit] += 1
+            else:
+                weights[bit] -= 1
+    fp = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            fp |= 1 << bit
+    return fp
+
+
+def _is_low_signal(rss_items: List[Dict[str, str]]) -> bool:
+    """是否低信号输入（像样的标题不足 2 条，LLM 整理大概率空手而归）"""
+    return sum(1 for x in rss_items if len(x.get("title") or "") > 15) < 2
+
+
+def _synth_minimal_news(dimension: str, rss_items: List[Dict[str, str]]) -> List[Dict]:
+    """低信号兜底：直接从 RSS 条目合成最简结构，省掉一次 LLM 往返"""
+    return [
+        {
+            "date": x.get("pubDate", ""),
+            "title": (x.get("title") or "")[:140],
+            "summary": (x.get("title") or "")[:140],
+            "dimension": dimension,
+            "relevance": "",
+            "importance": "低",
+            "source": x.get("source", ""),
+            "url": x.get("link", ""),
+        }
+        for x in rss_items[:3]
+        if x.get("title")
+    ]
+
+
+def _compact_bullets(rss_items: List[Dict[str, str]]) -> Tuple[str, Dict[int, str]]:
+    """原始条目 -> 编号 bullet 列表 + 编号->URL 映射。
+
+    dict repr 里的键名/引号/Google 重定向长链接都是纯 token 浪费；
+    模型只需要标题/来源/日期来做筛选，URL 由 ref_id 在本地回填。
+    """
+    sel = rss_items[:8]
+    bullets = "\n".join(
+        f"{i + 1}. [{x.get('source', '')}|{x.get('pubDate', '')}] {(x.get('title') or '')[:140]}"
+        for i, x in enumerate(sel)
+    )
+    id_to_url = {i + 1: x.get("link", "") for i, x in enumerate(sel)}
+    return bullets, id_to_url
+
+
+def _attach_urls(news: List[Dict], id_to_url: Dict[int, str]) -> None:
+    """按模型回传的 ref_id 回填原始 URL（模型不可靠输出长链接）"""
+    for n in news:
+        ref = n.pop("ref_id", None)
+        try:
+            n["url"] = id_to_url.get(int(ref), "") if ref is not None else n.get("url", "")
+        except (TypeError, ValueError):
+            n.setdefault("url", "")
+
+
+# 新闻标题尾部的媒体署名（"标题 - 新浪财经" / "标题 | Reuters"），
+# 指纹前剥掉，否则同一标题因署名差异拉开 Hamming 距离
+_TITLE_SUFFIX_RE = re.compile(r'\s+[-—|]\s+\S{1,20}$')
+
+
+def _dedupe_news(all_news: List[Dict]) -> List[Dict]:
+    """新闻去重：先 O(n) 清掉完全同题，再做 SimHash 近重复合并。
+
+    近重复判定为 Hamming 距离 ≤6（约 90% 相似），冲突时保留 importance
+    更高的一条。多 provider 联合检索里大头是逐字同题（同一篇被两个源
+    各返回一次），集合预筛后二次循环只剩真正需要比对的独立标题。
+    对这里的 N（4 维度 x ≤8 条）纯 Python 位运算足够，
+    int.bit_count 本身就是 C 实现，不值得为此引入 numpy。
+    """
+    seen_exact = set()
+    uniq: List[Dict] = []
+    fingerprints: List[int] = []
+    for n in all_news:
+        t = (n.get('title') or '').lower().strip()
+        if not t:
+            continue
+        stripped = _TITLE_SUFFIX_RE.sub('', t)
+        if len(stripped) >= 8:
+            t = stripped
+        if t in seen_exact:
+            continue
+        seen_exact.add(t)
+        fp = _simhash64(t)
+        for i, kept_fp in enumerate(fingerprints):
+            if ((fp ^ kept_fp).bit_count()) <= 6:
+                if (_IMP_RANK.get(n.get('importance', '低'), 2)
+                        < _IMP_RANK.get(uniq[i].get('importance', '低'), 2)):
+                    uniq[i] = n
+                    fingerprints[i] = fp
+                break
+        else:
+            uniq.append(n)
+            fingerprints.append(fp)
+    return uniq
+
 
 class OpenAIClient:
     """OpenAI API 客户端（默认使用 gpt-5.2）"""
@@ -37,52 +189,224 @@ class OpenAIClient:
         if not self.api_key:
             raise ValueError("请设置 OPENAI_API_KEY 环境变量或在 config.json 中配置 openai_api_key")
 
-        self.client = OpenAI(api_key=self.api_key)
+        # 首次实例化时才导入 SDK（若测试已 patch 模块级 OpenAI 则跳过真实导入）
+        global OpenAI, httpx
+        if httpx is None:
+            import httpx  # noqa: F811
+        if OpenAI is None:
+            try:
+                from openai import OpenAI  # noqa: F811
+            except ImportError as e:
+                raise ImportError("请先安装 openai: pip install openai") from e
+
+        # 自定义连接池：文件分析/新闻整理已经是多线程 fan-out，默认 transport
+        # 在多请求并发时会反复 TLS 握手；这里放宽连接上限并保持 keepalive 复用。
+        # （不开 http2：需要额外的 h2 依赖，keepalive 复用已覆盖握手成本）
+        self._http = httpx.Client(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+        self.client = OpenAI(
+            api_key=self.api_key,
+            http_client=self._http,
+            max_retries=2,
+        )
         self.model = model
+        # RSS 进程内 TTL 缓存：(query, days, limit) -> (ts, items)。
+        # 同一会话里重复刷新 / 不同标的撞上相同宏观 query 时免掉整次抓取+解析
+        self._rss_cache: Dict[Tuple[str, int, int], Tuple[float, List[Dict[str, str]]]] = {}
+        # 新闻整理输出上限：5 条结构化 JSON 约 500 token，800 留足余量，
+        # 同时硬性封顶失控输出的生成时长和费用
+        self.max_search_tokens = 800
+
+    def chat(
+        self,
+        prompt: str,
+        history: Optional[List[Dict]] = None,
+        stream_callback: Optional[Callable[[str], None]] = None,
+        cache_ttl_seconds: Optional[int] = None,
+        skip_cache: bool = False,
+        response_format: Optional[Dict] = None,
+        max_completion_tokens: Optional[int] = None,
+    ) -> str:
+        """普通对话（与 GeminiClient.chat 对齐）
+
+        stream_callback: 若提供，则走流式接口，每个增量文本块回调一次；
+        返回值仍是拼接后的完整响应（调用方解析 JSON 等逻辑不受影响）。
+        cache_ttl_seconds: 覆盖缓存 TTL（默认 24h；时效性强的调用传更短值）。
+        skip_cache: 强制刷新，跳过读缓存（仍会写入最新结果）。
+        response_format: 透传 OpenAI response_format（如 {"type": "json_object"}）。
+        max_completion_tokens: 输出 token 硬上限（防失控输出拖长生成/抬高成本）。
+        """
+        messages: List[Dict[str, str]] = _normalize_history(history)
+        messages.append({"role": "user", "content": prompt})
 
-    def chat(self, prompt: str, history: Optional[List[Dict]] = None) -> str:
-        """普通对话（与 GeminiClient.chat 对齐）"""
-        messages: List[Dict[str, str]] = []
-        if history:
-            for msg in history:
-                role = msg.get("role")
-                if role in ("assistant", "model"):
-                    role = "assistant"
-                else:
-                    role = "user"
-                messages.append({"role": role, "content": msg.get("content", "")})
+        # 磁盘缓存：chat 调用不设温度，同一 (model, messages) 的输出近似确定
+        extra_kwargs: Dict[str, Any] = {}
+        if response_format is not None:
+            extra_kwargs["response_format"] = response_format
+        if max_completion_tokens is not None:
+            extra_kwargs["max_completion_tokens"] = max_completion_tokens
+
+        key = llm_cache.make_key(self.model, messages, extra=extra_kwargs or None)
+        ttl = cache_ttl_seconds if cache_ttl_seconds is not None else llm_cache.DEFAULT_TTL_SECONDS
+        cached = None if skip_cache else llm_cache.get(key, ttl)
+        if cached is not None:
+            if stream_callback:
+                stream_callback(cached)
+            return cached
+
+        if stream_callback:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=120,
+                stream=True,
+                **extra_kwargs,
+            )
+            parts: List[str] = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    stream_callback(delta)
+            text = "".join(parts)
+        else:
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=120,
+                **extra_kwargs,
+            )
+            text = resp.choices[0].message.content or ""
+        if text:
+            llm_cache.put(key, text)
+        return text
+
+    def chat_stream(self, prompt: str, history: Optional[List[Dict]] = None) -> Iterator[str]:
+        """流式对话：逐块产出增量文本。
+
+        与 chat(stream_callback=...) 的区别：生成器形态允许调用方提前 break
+        （例如 JSON fence 已闭合时），SDK 会随之终止底层流，省掉尾部 token
+        的生成等待。因为流可能被截断，这条路径不写磁盘缓存。
+        """
+        messages: List[Dict[str, str]] = _normalize_history(history)
         messages.append({"role": "user", "content": prompt})
 
-        resp = self.client.chat.completions.create(
+        stream = self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             timeout=120,
+            stream=True,
         )
-        return resp.choices[0].message.content or ""
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
 
     def chat_with_system(self, system_prompt: str, user_message: str,
-                         history: Optional[List[Dict]] = None) -> str:
-        """带系统提示的对话（与 GeminiClient.chat_with_system 对齐）"""
+                         history: Optional[List[Dict]] = None,
+                         stream_callback: Optional[Callable[[str], None]] = None) -> str:
+        """带系统提示的对话（与 GeminiClient.chat_with_system 对齐）
+
+        stream_callback: 同 chat，提供则走流式接口并逐块回调。
+        """
         messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        messages.extend(_normalize_history(history))
+        messages.append({"role": "user", "content": user_message})
 
-        if history:
-            for msg in history:
-                role = msg.get("role")
-                if role in ("assistant", "model"):
-                    role = "assistant"
-                else:
-                    role = "user"
-                messages.append({"role": role, "content": msg.get("content", "")})
+        # 与 chat 同一套缓存：system prompt 已含在 messages 里，key 自然区分
+        key = llm_cache.make_key(self.model, messages)
+        cached = llm_cache.get(key)
+        if cached is not None:
+            if stream_callback:
+                stream_callback(cached)
+            return cached
+
+        if stream_callback:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=120,
+                stream=True,
+            )
+            parts: List[str] = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    stream_callback(delta)
+            text = "".join(parts)
+        else:
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                timeout=120,
+            )
+            text = resp.choices[0].message.content or ""
+        if text:
+            llm_cache.put(key, text)
+        return text
+
+    def _read_bytes(self, path: Path) -> bytes:
+        """mmap 读取文件内容：单次拷贝，无 read() 的中间缓冲"""
+        import mmap
+
+        with open(path, "rb") as f:
+            if path.stat().st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return bytes(mm)
+
+    def analyze_file(self, file_path: str, prompt: str) -> str:
+        """分析本地文件（文本直读 / 图片内嵌 / PDF 与大文件走 Files API）
+
+        - 文本类后缀直接读入 prompt，走普通 chat
+        - 图片 mmap 读取后以 base64 data URL 内嵌
+        - PDF 或超过 20MB 的文件用 files.create 流式上传，
+          SDK 从文件句柄分块读，不在进程内物化整个文件
+        """
+        path = Path(file_path)
+        suffix = path.suffix.lower()
+
+        if suffix in _TEXT_EXT:
+            text = path.read_text("utf-8", errors="replace")
+            return self.chat(f"{prompt}\n\n## 文件内容（{path.name}）\n{text}")
+
+        mime = _MIME_MAP.get(suffix)
+        if mime is None:
+            return f"不支持的文件类型: {suffix}"
+        if suffix == ".pdf" or path.stat().st_size > _UPLOAD_THRESHOLD_BYTES:
+            with open(path, "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose="user_data")
+            content = [
+                {"type": "file", "file": {"file_id": uploaded.id}},
+                {"type": "text", "text": prompt},
+            ]
+        else:
+            import base64
 
-        messages.append({"role": "user", "content": user_message})
+            data = base64.b64encode(self._read_bytes(path)).decode("ascii")
+            content = [
+                {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{data}"}},
+                {"type": "text", "text": prompt},
+            ]
 
         resp = self.client.chat.completions.create(
             model=self.model,
-            messages=messages,
+            messages=[{"role": "user", "content": content}],
             timeout=120,
         )
         return resp.choices[0].message.content or ""
 
+    def analyze_files(self, file_paths: List[str], prompt: str) -> List[str]:
+        """批量分析：I/O + API 往返并行，结果按入参顺序返回"""
+        if not file_paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(5, len(file_paths))) as executor:
+            futures = [executor.submit(self.analyze_file, p, prompt) for p in file_paths]
+            return [f.result() for f in futures]
+
     def search(self, query: str, time_range_days: int = 7) -> str:
         """降级：不进行联网搜索，仅返回提示。
 
@@ -97,16 +421,60 @@ class OpenAIClient:
             f"range={start_date.strftime('%Y-%m-%d')}..{end_date.strftime('%Y-%m-%d')}\n"
         )
 
+    def close(self) -> None:
+        """释放连接池（长驻进程退出前调用；CLI 场景进程退出自然回收）"""
+        try:
+            self._http.close()
+        except Exception:
+            pass
+
     # 兼容调用方可能使用的属性名
     @property
     def model_pro(self) -> str:
         return self.model
 
+    def _store_rss_cache(self, key: Tuple[str, int, int], items: List[Dict[str, str]]) -> None:
+        """写入 RSS 缓存；超过 256 个条目时按时间戳淘汰最旧的"""
+        import time
+
+        self._rss_cache[key] = (time.time(), list(items))
+        if len(self._rss_cache) > 256:
+            oldest = min(self._rss_cache, key=lambda k: self._rss_cache[k][0])
+            del self._rss_cache[oldest]
+
     def _fetch_google_news_rss(self, query: str, time_range_days: int, limit: int = 8) -> Tuple[List[Dict[str, str]], Optional[str]]:
         """Fetch Google News RSS items.
 
         Returns (items, error). Each item: {title, link, pubDate, source}.
         """
+        import time
+
+        cache_key = (query, time_range_days, limit)
+        cached = self._rss_cache.get(cache_key)
+        if cached is not None and time.time() - cached[0] < 15 * 60:
+            return list(cached[1]), None
+
+        import urllib.parse
+        from email.utils import parsedate_to_datetime
+
+        try:
+            # C 实现 + 流式 + 可提前退出；未安装时走 stdlib DOM 解析
+            from lxml import etree as lxml_etree
+        except ImportError:
+            lxml_etree = None
+
+        def _collect(it, items: List[Dict[str, str]]) -> None:
+            title = (it.findtext('title') or '').strip()
+            link = (it.findtext('link') or '').strip()
+            pub_raw = (it.findtext('pubDate') or '').strip()
+            try:
+                pub = parsedate_to_datetime(pub_raw).strftime('%Y-%m-%d')
+            except Exception:
+                pub = pub_raw
+            source = (it.findtext('source') or '').strip()
+            if title:
+                items.append({"title": title, "link": link, "pubDate": pub, "source": source})
+
         try:
             # enforce freshness using Google News query operator when:N d
             # (best-effort; Google may ignore in some cases)
@@ -116,27 +484,32 @@ class OpenAIClient:
             q = urllib.parse.quote(q_str)
             # CN zh RSS is generally better for Chinese names; still includes global sources.
             url = f"https://news.google.com/rss/search?q={q}&hl=zh-CN&gl=CN&ceid=CN:zh-Hans"
-            with urllib.request.urlopen(url, timeout=20) as resp:
-                xml_bytes = resp.read()
+            items: List[Dict[str, str]] = []
+            # 复用 OpenAI 同一个 httpx 连接池：4 个维度并发抓取时
+            # news.google.com 的 TLS 连接 keepalive 复用，不再逐次握手
+            resp = self._http.get(url, timeout=20.0, follow_redirects=True)
+            resp.raise_for_status()
+            xml_bytes = resp.content
+            if lxml_etree is not None:
+                # C 解析器 + 凑够 limit 条即停，不物化整棵 DOM
+                import io
+                for _event, elem in lxml_etree.iterparse(io.BytesIO(xml_bytes), events=('end',), tag='item'):
+                    _collect(elem, items)
+                    elem.clear()
+                    if len(items) >= limit:
+                        break
+                self._store_rss_cache(cache_key, items)
+                return items, None
+            import xml.etree.ElementTree as ET
             root = ET.fromstring(xml_bytes)
             channel = root.find('channel')
             if channel is None:
                 return [], None
-            items = []
             for it in channel.findall('item'):
-                title = (it.findtext('title') or '').strip()
-                link = (it.findtext('link') or '').strip()
-                pub_raw = (it.findtext('pubDate') or '').strip()
-                try:
-                    pub = parsedate_to_datetime(pub_raw).strftime('%Y-%m-%d')
-                except Exception:
-                    pub = pub_raw
-                source = (it.findtext('source') or '').strip()
-                if not title:
-                    continue
-                items.append({"title": title, "link": link, "pubDate": pub, "source": source})
+                _collect(it, items)
                 if len(items) >= limit:
                     break
+            self._store_rss_cache(cache_key, items)
             return items, None
         except Exception as e:
             return [], str(e)
@@ -150,56 +523,200 @@ class OpenAIClient:
     ) -> List[Dict]:
         if not rss_items:
             return []
+        if _is_low_signal(rss_items):
+            return _synth_minimal_news(dimension, rss_items)
 
-        # Keep prompt small; provide the raw items and ask for strict JSON.
-        compact = []
-        for x in rss_items[:8]:
-            compact.append({
-                "title": x.get("title", ""),
-                "source": x.get("source", ""),
-                "date": x.get("pubDate", ""),
-                "link": x.get("link", ""),
-            })
+        # Keep prompt small: numbered bullets instead of dict repr,
+        # URLs stay local and get re-attached by ref_id after parsing.
+        bullets, id_to_url = _compact_bullets(rss_items)
 
         prompt = f"""你在做投资环境跟踪。目标公司/标的：{stock_name}
 
 维度：{dimension}
 关注点：{focus}
 
-下面是 Google News RSS 抓取到的原始条目（可能有噪音/重复/标题党），请你筛出最多 5 条最重要的，并严格输出 JSON（只输出 JSON，不要解释）：
+下面是抓取到的原始条目（可能有噪音/重复/标题党），请你筛出最多 5 条最重要的，并严格输出 JSON（只输出 JSON，不要解释）。ref_id 为所选条目的编号：
 
 {{
   \"news\": [
     {{
-      \"date\": \"YYYY-MM-DD\",  # 如果无法解析日期，可留空字符串
+      \"ref_id\": 1,
+      \"date\": \"YYYY-MM-DD\",
       \"title\": \"...\",
       \"summary\": \"1-2 句摘要\",
       \"dimension\": \"{dimension}\",
       \"relevance\": \"与投资逻辑的关联说明\",
       \"importance\": \"高/中/低\",
-      \"source\": \"...\",
-      \"url\": \"...\"
+      \"source\": \"...\"
     }}
   ]
 }}
 
 原始条目：
-{compact}
+{bullets}
 """
 
-        text = self.chat(prompt)
-        # extract json
-        m = re.search(r'\{[\s\S]*\}', text)
-        if not m:
-            return []
+        # 新闻时效性强：缓存 30 分钟，够覆盖同一会话内的重复刷新。
+        # JSON 模式让模型省掉 ```json fence（少生成 token，也免一次正则）
+        text = self.chat(
+            prompt,
+            cache_ttl_seconds=1800,
+            response_format={"type": "json_object"},
+            max_completion_tokens=self.max_search_tokens,
+        )
         try:
-            obj = json.loads(m.group(0))
-            out = obj.get('news', [])
-            for n in out:
-                n['dimension'] = dimension
-            return out[:5]
-        except Exception:
-            return []
+            obj = _json_loads(text)
+        except ValueError:
+            # 防御：历史缓存 / 不支持 JSON 模式的兼容端点仍可能带 fence
+            m = _BRACE_SPAN_RE.search(text)
+            if not m:
+                return []
+            try:
+                obj = _json_loads(m.group(0))
+            except ValueError:
+                return []
+        out = obj.get('news', []) if isinstance(obj, dict) else []
+        out = [n for n in out if isinstance(n, dict)][:5]
+        _attach_urls(out, id_to_url)
+        for n in out:
+            n['dimension'] = dimension
+        return out
+
+    def _semantic_merge(self, news: List[Dict]) -> List[Dict]:
+        """跨维度语义去重：同一事件的不同标题角度（公司公告 vs 行业解读）
+        SimHash 抓不住，用一次批量 embedding + 余弦聚类合并。
+
+        embeddings 调用失败时由调用方回退 SimHash 结果；纯增强路径。
+        """
+        if len(news) < 2:
+            return news
+        titles = [n.get("title") or "" for n in news]
+        resp = self.client.embeddings.create(
+            model="text-embedding-3-small", input=titles
+        )
+        vecs = [d.embedding for d in resp.data]
+        norms = [math.sqrt(sum(v * v for v in vec)) or 1.0 for vec in vecs]
+
+        # union-find：余弦 ≥ 0.88 视为同一事件
+        parent = list(range(len(news)))
+
+        def _find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i in range(len(news)):
+            for j in range(i + 1, len(news)):
+                cos = sum(a * b for a, b in zip(vecs[i], vecs[j])) / (norms[i] * norms[j])
+                if cos >= 0.88:
+                    parent[_find(j)] = _find(i)
+
+        # 每簇保留 importance 最高的一条，维持原有顺序
+        best: Dict[int, int] = {}
+        for idx in range(len(news)):
+            root = _find(idx)
+            cur = best.get(root)
+            if cur is None or (_IMP_RANK.get(news[idx].get('importance', '低'), 2)
+                               < _IMP_RANK.get(news[cur].get('importance', '低'), 2)):
+                best[root] = idx
+        keep = sorted(best.values())
+        return [news[i] for i in keep]
+
+    def _fetch_dim(
+        self,
+        q: str,
+        time_range_days: int,
+        sm,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """单维度检索（provider 或 RSS 兜底），返回 (rss_like_items, error)"""
+        if sm is not None:
+            hits = sm.search(q, max_results=8, topic="news", depth="basic")
+            return [
+                {
+                    "title": h.title,
+                    "source": h.provider,
+                    "pubDate": h.published or "",
+                    "link": h.url,
+                }
+                for h in hits
+                if h.title and h.url
+            ], None
+        return self._fetch_google_news_rss(q, time_range_days=time_range_days, limit=8)
+
+    def _rss_items_to_structured_news_batch(
+        self,
+        stock_name: str,
+        dim_blocks: List[Tuple[str, str, List[Dict]]],
+    ) -> Optional[Dict[str, List[Dict]]]:
+        """四个维度合并为一次 LLM 调用做结构化。
+
+        单次调用摊薄 HTTP/TLS 与公共指令 token（四个维度的说明几乎相同），
+        也让 OpenAI 隐式 prompt cache 更容易命中公共前缀。
+        解析失败返回 None，调用方回退逐维度路径。
+        """
+        blocks = []
+        id_maps: Dict[str, Dict[int, str]] = {}
+        for dim, focus, items in dim_blocks:
+            bullets, id_to_url = _compact_bullets(items)
+            id_maps[dim] = id_to_url
+            blocks.append(f"### 维度：{dim}\n关注点：{focus}\n原始条目：\n{bullets}")
+
+        prompt = f"""你在做投资环境跟踪。目标公司/标的：{stock_name}
+
+下面按维度给出抓取到的原始条目（可能有噪音/重复/标题党）。
+请对每个维度筛出最多 5 条最重要的，并严格输出 JSON（只输出 JSON，不要解释）。
+ref_id 为所选条目在该维度列表中的编号：
+
+{{
+  "by_dimension": {{
+    "<维度名>": [
+      {{
+        "ref_id": 1,
+        "date": "YYYY-MM-DD",
+        "title": "...",
+        "summary": "1-2 句摘要",
+        "relevance": "与投资逻辑的关联说明",
+        "importance": "高/中/低",
+        "source": "..."
+      }}
+    ]
+  }}
+}}
+
+{chr(10).join(blocks)}
+"""
+
+        text = self.chat(
+            prompt,
+            cache_ttl_seconds=1800,
+            response_format={"type": "json_object"},
+            max_completion_tokens=self.max_search_tokens * len(dim_blocks),
+        )
+        try:
+            obj = _json_loads(text)
+        except ValueError:
+            m = _BRACE_SPAN_RE.search(text)
+            if not m:
+                return None
+            try:
+                obj = _json_loads(m.group(0))
+            except ValueError:
+                return None
+        by_dim = obj.get("by_dimension") if isinstance(obj, dict) else None
+        if not isinstance(by_dim, dict):
+            return None
+        out: Dict[str, List[Dict]] = {}
+        for dim, _focus, _items in dim_blocks:
+            news = by_dim.get(dim)
+            if not isinstance(news, list):
+                news = []
+            news = [n for n in news if isinstance(n, dict)][:5]
+            _attach_urls(news, id_maps[dim])
+            for n in news:
+                n["dimension"] = dim
+            out[dim] = news
+        return out
 
     def search_news_structured(
         self,
@@ -243,45 +760,73 @@ class OpenAIClient:
             hard_timeout_seconds=20,
         )
 
-        if not sm.providers:
+        if sm.providers:
+            warnings.append("新闻来源=Tavily + Brave Search（union）。")
+        else:
+            sm = None
             warnings.append("未配置检索 Provider，降级到 Google News RSS。")
-            for dim, q, focus in dims:
-                items, err = self._fetch_google_news_rss(q, time_range_days=time_range_days, limit=8)
+
+        # 检索仍按维度并行（I/O 各自独立），LLM 结构化合并成一次调用；
+        # 按提交顺序收集保持结果确定性
+        dim_blocks: List[Tuple[str, str, List[Dict]]] = []
+        with ThreadPoolExecutor(max_workers=len(dims)) as executor:
+            futures = [
+                (dim, focus, executor.submit(self._fetch_dim, q, time_range_days, sm))
+                for dim, q, focus in dims
+            ]
+            for dim, focus, future in futures:
+                try:
+                    items, err = future.result()
+                except Exception as e:
+                    failed.append({"dimension": dim, "error": str(e)})
+                    continue
                 if err:
                     failed.append({"dimension": dim, "error": err})
+                elif not items:
                     continue
-                structured = self._rss_items_to_structured_news(stock_name, dim, focus, items)
-                all_news.extend(structured)
-        else:
-            warnings.append("新闻来源=Tavily + Brave Search（union）。")
-            for dim, q, focus in dims:
-                hits = sm.search(q, max_results=8, topic="news", depth="basic")
-                rss_like = [
-                    {
-                        "title": h.title,
-                        "source": h.provider,
-                        "pubDate": h.published or "",
-                        "link": h.url,
-                    }
-                    for h in hits
-                    if h.title and h.url
-                ]
-                structured = self._rss_items_to_structured_news(stock_name, dim, focus, rss_like)
-                all_news.extend(structured)
-
-        # naive de-dup by title prefix
-        seen = set()
-        uniq = []
-        for n in all_news:
-            t = (n.get('title') or '').lower().strip()[:60]
-            if not t or t in seen:
-                continue
-            seen.add(t)
-            uniq.append(n)
-
-        # sort by importance then date (best-effort)
-        imp = {"高": 0, "中": 1, "低": 2}
-        uniq.sort(key=lambda x: (imp.get(x.get('importance', '低'), 2), x.get('date', '')), reverse=False)
+                elif _is_low_signal(items):
+                    # 低信号维度不值一次 LLM 往返，直接合成最简条目
+                    all_news.extend(_synth_minimal_news(dim, items))
+                else:
+                    dim_blocks.append((dim, focus, items))
+
+        if dim_blocks:
+            by_dim = self._rss_items_to_structured_news_batch(stock_name, dim_blocks)
+            if by_dim is not None:
+                for dim, _focus, _items in dim_blocks:
+                    all_news.extend(by_dim.get(dim, []))
+            else:
+                # 批量解析失败：回退逐维度调用（并行），条目已抓取无需重抓
+                warnings.append("批量结构化解析失败，回退逐维度调用。")
+                with ThreadPoolExecutor(max_workers=len(dim_blocks)) as executor:
+                    futures = [
+                        (dim, executor.submit(
+                            self._rss_items_to_structured_news, stock_name, dim, focus, items))
+                        for dim, focus, items in dim_blocks
+                    ]
+                    for dim, future in futures:
+                        try:
+                            all_news.extend(future.result())
+                        except Exception as e:
+                            failed.append({"dimension": dim, "error": str(e)})
+
+        uniq = _dedupe_news(all_news)
+        try:
+            uniq = self._semantic_merge(uniq)
+        except Exception:
+            pass  # 语义合并是增强项，embedding 不可用时 SimHash 结果已够用
+
+        # sort by importance then date (best-effort)；与截断融合：
+        # 只要前 20 条，heapq.nsmallest 是 O(n log 20)，免去整表排序。
+        # 排序键先一次性物化（每条两次 dict.get 只做一遍，比较时零 Python 调用）
+        sort_keys = [
+            (_IMP_RANK.get(n.get('importance', '低'), 2), n.get('date', ''))
+            for n in uniq
+        ]
+        top = [
+            uniq[i]
+            for i in heapq.nsmallest(20, range(len(uniq)), key=sort_keys.__getitem__)
+        ]
 
         metadata = {
             "_is_metadata": True,
@@ -295,7 +840,7 @@ class OpenAIClient:
             ],
         }
 
-        result = uniq[:20]
+        result = top
         result.insert(0, metadata)
         return result
 
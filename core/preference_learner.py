@@ -1,12 +1,125 @@
 """用户偏好学习模块"""
 
-import json
+import io
 import re
-from typing import Dict, List, Optional
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, FrozenSet, List, Optional, Tuple
 from datetime import datetime
 
 from .openai_client import OpenAIClient
 from .storage import Storage
+from utils.json_compat import loads as _json_loads, dumps as _json_dumps
+from utils.prompt_template import compile_template, render as _render_template
+
+
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+
+
+def _cell(value) -> str:
+    """markdown 表格单元格安全化：空值给占位符，压掉会破坏表格的字符"""
+    if not value:
+        return "—"
+    return str(value).replace("\n", " ").replace("|", "/")
+
+
+def _fmt_feedbacks(items: List[Dict], buf: io.StringIO) -> None:
+    buf.write("\n### 研究反馈\n")
+    buf.write("| 时间 | 股票 | AI建议 | 信心 | 用户决策 | 用户反馈 | 希望的研究方向 |\n")
+    buf.write("|---|---|---|---|---|---|---|\n")
+    for inter in items:
+        ctx = inter.get("context", {})
+        fb = inter.get("user_feedback", {})
+        buf.write(
+            f"| {inter.get('timestamp', '')[:10]} | {_cell(inter.get('stock_name'))} "
+            f"| {_cell(ctx.get('ai_recommendation'))} | {_cell(ctx.get('ai_confidence'))} "
+            f"| {_cell(fb.get('decision'))} | {_cell(fb.get('feedback_on_research'))} "
+            f"| {_cell(fb.get('further_research_direction'))} |\n"
+        )
+
+
+def _fmt_adjustments(items: List[Dict], buf: io.StringIO) -> None:
+    buf.write("\n### 计划调整\n")
+    buf.write("| 时间 | 股票 | 用户调整请求 |\n|---|---|---|\n")
+    for inter in items:
+        buf.write(
+            f"| {inter.get('timestamp', '')[:10]} | {_cell(inter.get('stock_name'))} "
+            f"| {_cell(inter.get('user_adjustment'))} |\n"
+        )
+
+
+def _fmt_questions(items: List[Dict], buf: io.StringIO) -> None:
+    buf.write("\n### 用户追问\n")
+    buf.write("| 时间 | 股票 | 追问内容 |\n|---|---|---|\n")
+    for inter in items:
+        buf.write(
+            f"| {inter.get('timestamp', '')[:10]} | {_cell(inter.get('stock_name'))} "
+            f"| {_cell(inter.get('user_question'))} |\n"
+        )
+
+
+def _fmt_edits(items: List[Dict], buf: io.StringIO) -> None:
+    buf.write("\n### Playbook 编辑\n")
+    buf.write("| 时间 | 股票 | 编辑类型 | 变更 |\n|---|---|---|---|\n")
+    for inter in items:
+        buf.write(
+            f"| {inter.get('timestamp', '')[:10]} | {_cell(inter.get('stock_name'))} "
+            f"| {_cell(inter.get('edit_type'))} | {_cell(_json_dumps(inter.get('changes', {})))} |\n"
+        )
+
+
+# 分桶输出的固定顺序：类型 -> 对应 formatter
+_BUCKET_FORMATTERS = (
+    ("research_feedback", _fmt_feedbacks),
+    ("plan_adjustment", _fmt_adjustments),
+    ("follow_up_question", _fmt_questions),
+    ("playbook_edit", _fmt_edits),
+)
+
+
+def _within_edit_distance(a: str, b: str, k: int) -> bool:
+    """带状 Wagner-Fischer：编辑距离 <= k 时返回 True
+
+    只计算主对角线 ±k 带内的单元（O(k·min(n,m))，无整表分配），
+    某一行整行都超过 k 就提前终止——绝大多数不相似对在前几行就退出。
+    """
+    if k <= 0:
+        return a == b
+    la, lb = len(a), len(b)
+    if abs(la - lb) > k:
+        return False
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    inf = k + 1
+    prev = [min(j, inf) for j in range(la + 1)]
+    for i in range(1, lb + 1):
+        lo = max(1, i - k)
+        hi = min(la, i + k)
+        cur = [inf] * (la + 1)
+        if lo == 1:
+            cur[0] = min(i, inf)
+        bi = b[i - 1]
+        best = cur[0]
+        for j in range(lo, hi + 1):
+            v = min(
+                prev[j] + 1,
+                cur[j - 1] + 1,
+                prev[j - 1] + (0 if a[j - 1] == bi else 1),
+            )
+            cur[j] = v if v < inf else inf
+            if cur[j] < best:
+                best = cur[j]
+        if best > k:
+            return False
+        prev = cur
+    return prev[la] <= k
+
+
+def _trigger_tokens(text: str) -> FrozenSet[str]:
+    """trigger 文本的字符 2-gram 集合（中文无空格，bigram 充当 token）"""
+    if len(text) < 2:
+        return frozenset((text,))
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1))
 
 
 PREFERENCE_EXTRACTION_PROMPT = """## 角色
@@ -47,6 +160,9 @@ PREFERENCE_EXTRACTION_PROMPT = """## 角色
 2. 偏好要具体、可操作
 3. 如果信息不足以提取偏好，返回空数组"""
 
+# import 时编译一次：渲染免去 .format 对整个模板的逐次重新解析
+_EXTRACTION_PARTS = compile_template(PREFERENCE_EXTRACTION_PROMPT)
+
 
 class PreferenceLearner:
     """用户偏好学习器"""
@@ -54,6 +170,9 @@ class PreferenceLearner:
     def __init__(self, client: OpenAIClient, storage: Storage):
         self.client = client
         self.storage = storage
+        # 后台提取线程：单 worker，既不阻塞调用方，又保证多次触发
+        # 串行执行（偏好存储的读改写不会并发交叠）
+        self._bg = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pref-learn")
 
     def log_feedback_interaction(
         self,
@@ -153,7 +272,7 @@ class PreferenceLearner:
         interaction_text = self._format_interactions(interactions)
 
         # 调用 AI 提取偏好
-        prompt = PREFERENCE_EXTRACTION_PROMPT.format(interaction_data=interaction_text)
+        prompt = _render_template(_EXTRACTION_PARTS, {"interaction_data": interaction_text})
         response = self.client.chat(prompt)
 
         # 解析结果
@@ -167,11 +286,20 @@ class PreferenceLearner:
         """学习并保存偏好"""
         result = self.extract_preferences_from_interactions()
 
-        # 保存提取的偏好
-        for pref in result.get("extracted_preferences", []):
+        # 保存提取的偏好：已有偏好只读一次并预建 bigram 索引，
+        # 去重从"每条新偏好重新读盘 + 全量子串扫描"变为一次索引查询
+        new_prefs = result.get("extracted_preferences", [])
+        index: List[Tuple[str, FrozenSet[str]]] = []
+        if new_prefs:
+            for p in self.storage.get_active_preferences():
+                trig = p.get("trigger", "").lower()
+                index.append((trig, _trigger_tokens(trig)))
+
+        to_save: List[Dict] = []
+        for pref in new_prefs:
             # 检查是否已存在类似偏好
-            if not self._preference_exists(pref):
-                self.storage.add_preference({
+            if not self._preference_exists(pref, index):
+                to_save.append({
                     "trigger": pref.get("trigger", ""),
                     "my_response": pref.get("my_response", ""),
                     "category": pref.get("category", "general"),
@@ -179,6 +307,13 @@ class PreferenceLearner:
                     "reasoning": pref.get("reasoning", ""),
                     "source": "auto_extracted"
                 })
+                # 待保存的也进索引，同一批内的重复同样会被拦下
+                trig = pref.get("trigger", "").lower()
+                index.append((trig, _trigger_tokens(trig)))
+
+        if to_save:
+            # 整批一次写盘，而不是每条各做一轮偏好文件的读改写
+            self.storage.add_preferences_bulk(to_save)
 
         # 更新偏好总结
         summary = result.get("preference_summary", {})
@@ -190,16 +325,41 @@ class PreferenceLearner:
 
         return result
 
-    def _preference_exists(self, new_pref: Dict) -> bool:
-        """检查偏好是否已存在"""
-        existing = self.storage.get_active_preferences()
-        new_trigger = new_pref.get("trigger", "").lower()
+    def learn_and_save_preferences_async(self) -> Future:
+        """后台执行 learn_and_save_preferences，立即返回 Future
 
-        for pref in existing:
-            existing_trigger = pref.get("trigger", "").lower()
-            # 简单的相似度检查
+        提取的主开销是一次秒级 LLM 调用；调用方不需要马上拿到结果时
+        （例如交互落盘后的触发式学习）不必把用户可见延迟耗在这上面。
+        需要结果时对返回的 Future 调 .result() 即可。
+        """
+        return self._bg.submit(self.learn_and_save_preferences)
+
+    def _preference_exists(self, new_pref: Dict,
+                           index: List[Tuple[str, FrozenSet[str]]]) -> bool:
+        """检查偏好是否已存在（相互子串包含，或 bigram Jaccard >= 0.6）
+
+        index 由调用方预构建：[(trigger 小写, 其 bigram 集合)]。
+        子串关系必然共享 bigram，先做集合交集筛掉绝大多数候选，
+        只对有交集的少数候选再做逐字符的子串/相似度比较。
+        """
+        new_trigger = new_pref.get("trigger", "").lower()
+        if not new_trigger:
+            return bool(index)
+        new_tokens = _trigger_tokens(new_trigger)
+
+        for existing_trigger, tokens in index:
+            inter = tokens & new_tokens
+            if not inter:
+                continue
             if new_trigger in existing_trigger or existing_trigger in new_trigger:
                 return True
+            if len(inter) / len(tokens | new_tokens) >= 0.6:
+                return True
+            # 错别字/近义改写：子串和 Jaccard 都抓不住一两个字的差异，
+            # 有界编辑距离兜底（阈值随长度放宽，短 trigger 至少容 1 字）
+            cutoff = max(1, min(len(existing_trigger), len(new_trigger)) // 8)
+            if _within_edit_distance(existing_trigger, new_trigger, cutoff):
+                return True
         return False
 
     def _merge_summaries(self, current: Dict, new: Dict) -> Dict:
@@ -220,49 +380,36 @@ class PreferenceLearner:
         return merged
 
     def _format_interactions(self, interactions: List[Dict]) -> str:
-        """格式化交互数据"""
-        lines = []
-        for i, inter in enumerate(interactions, 1):
-            lines.append(f"\n### 交互 {i} ({inter.get('type', 'unknown')})")
-            lines.append(f"时间: {inter.get('timestamp', '')[:10]}")
-
-            if inter.get("stock_name"):
-                lines.append(f"股票: {inter.get('stock_name')}")
-
-            if inter["type"] == "research_feedback":
-                ctx = inter.get("context", {})
-                fb = inter.get("user_feedback", {})
-                lines.append(f"AI建议: {ctx.get('ai_recommendation', '')} (信心: {ctx.get('ai_confidence', '')})")
-                lines.append(f"用户决策: {fb.get('decision', '')}")
-                if fb.get("feedback_on_research"):
-                    lines.append(f"用户反馈: {fb.get('feedback_on_research')}")
-                if fb.get("further_research_direction"):
-                    lines.append(f"用户希望的研究方向: {fb.get('further_research_direction')}")
-
-            elif inter["type"] == "plan_adjustment":
-                lines.append(f"用户调整请求: {inter.get('user_adjustment', '')}")
-
-            elif inter["type"] == "follow_up_question":
-                lines.append(f"用户追问: {inter.get('user_question', '')}")
-
-            elif inter["type"] == "playbook_edit":
-                lines.append(f"编辑类型: {inter.get('edit_type', '')}")
-                lines.append(f"变更: {json.dumps(inter.get('changes', {}), ensure_ascii=False)}")
-
-        return "\n".join(lines)
+        """格式化交互数据：按类型分桶，每桶一个专用 formatter 输出表格
+
+        逐条 prose 输出时每条交互要重复一遍字段名；表格把字段名
+        摊销到表头，token 数和字符串拼接量都随条数线性下降。
+        类型 -> formatter 的分发表替代逐条 if/elif 链，每个 formatter
+        只取它需要的字段。
+        """
+        by_type: Dict[str, List[Dict]] = defaultdict(list)
+        for inter in interactions:
+            by_type[inter.get("type", "unknown")].append(inter)
+
+        buf = io.StringIO()
+        for type_name, fmt in _BUCKET_FORMATTERS:
+            items = by_type.get(type_name)
+            if items:
+                fmt(items, buf)
+        return buf.getvalue()
 
     def _extract_json(self, response: str) -> Optional[Dict]:
         """从响应中提取 JSON"""
-        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
+        json_match = _CODE_BLOCK_RE.search(response)
         if json_match:
             try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
+                return _json_loads(json_match.group(1))
+            except ValueError:
                 pass
 
         try:
-            return json.loads(response)
-        except json.JSONDecodeError:
+            return _json_loads(response)
+        except ValueError:
             pass
 
         return None
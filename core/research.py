@@ -1,24 +1,72 @@
 """Deep Research 执行模块"""
 
-import json
+import io
 import re
 import os
-from typing import Dict, List, Optional
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 from .openai_client import OpenAIClient
 from .storage import Storage
 from .retrieval import SearchManager, TavilyProvider, OpenClawWebSearchProvider, format_search_results_for_prompt
-
-
-DEEP_RESEARCH_PROMPT = """## 角色定位
+from utils.json_compat import loads as _json_loads, dumps_pretty as _json_dumps_pretty
+from utils.prompt_template import compile_template, render as _render_template
+
+
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+
+# 搜索结果块的总量预算：prompt 成本/延迟随输入线性增长，模块多的
+# 研究计划能堆出 50KB+ 的搜索块。按 ~4 字符/token 粗算约 8000 token。
+_MAX_SEARCH_CHARS = 32000
+
+# 空输入时复用的占位常量（免去每次调用重建相同字符串）
+_EMPTY_PLAYBOOK_STR = "（暂无）"
+_EMPTY_ENV_STR = "（无变化数据）"
+_EMPTY_SEARCH_STR = "（未执行搜索）"
+
+def _now_iso() -> str:
+    """秒级 ISO 时间戳；time.strftime 免去 datetime 对象构造和 tz 机制"""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
+
+
+# 结论 JSON 的标志字段：平衡扫描到的对象含其一即视为结论
+_CONCLUSION_MARKERS = ('"research_date"', '"thesis_impact"')
+
+
+def _find_conclusion_json(s: str) -> Optional[str]:
+    """返回首个含结论标志字段的平衡 {...} 片段；单遍扫描，无回溯
+
+    替代原先的嵌套对象正则：长报告上该正则会灾难性回溯，
+    且只能匹配一层嵌套；深度计数扫描是 O(n) 的。
+    """
+    start = s.find("{")
+    depth = 0
+    i = start
+    while start != -1 and i < len(s):
+        c = s[i]
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                candidate = s[start:i + 1]
+                if any(m in candidate for m in _CONCLUSION_MARKERS):
+                    return candidate
+                start = s.find("{", i + 1)
+                i = start
+                continue
+        i += 1
+    return None
+
+
+# 提示词拆成 静态 system + 动态 user 两段：system 只含角色/Playbook/偏好/
+# 历史资料/输出格式等慢变内容（同一标的在 playbook 不变期间逐字节相同，
+# 命中 OpenAI 服务端的 prompt prefix cache，免掉大段 prefill）；
+# 每次研究真正变化的 environment/计划/搜索结果放在 user 消息尾部。
+DEEP_RESEARCH_SYSTEM = """## 角色定位
 你是一位顶级投资机构的首席研究员，以严谨的逻辑、深入的分析和独立的判断著称。你的研究报告直接影响数十亿美元的投资决策。
 
-## 研究背景
-
-**研究标的:** {stock_name}
-**研究触发原因:** {trigger_reason}
-
 ---
 
 ## 第一部分：用户的投资逻辑（Playbook）
@@ -36,19 +84,7 @@ DEEP_RESEARCH_PROMPT = """## 角色定位
 
 ---
 
-## 第二部分：历史研究上下文
-
-{research_history}
-
----
-
-## 第三部分：本次 Environment 变化
-
-{environment_changes}
-
----
-
-## 第四部分：历史上传资料
+## 第二部分：历史上传资料
 
 以下是用户在过往研究中上传的重要参考资料（研报、会议纪要等），请在分析时参考这些历史信息：
 
@@ -56,21 +92,9 @@ DEEP_RESEARCH_PROMPT = """## 角色定位
 
 ---
 
-## 第五部分：研究计划
-
-{research_plan}
-
----
-
-## 第六部分：补充搜索结果
-
-{search_results}
-
----
-
 ## 研究任务
 
-基于以上信息，完成一份【机构级别的深度研究报告】，要求：
+基于以上背景和用户消息中的最新信息（历史研究上下文 / Environment 变化 / 研究计划 / 补充搜索结果），完成一份【机构级别的深度研究报告】，要求：
 1. 分析必须有理有据，引用具体数据和事实
 2. 每个结论都要说明推理过程
 3. 明确区分"事实"、"推断"和"假设"
@@ -263,12 +287,64 @@ DEEP_RESEARCH_PROMPT = """## 角色定位
 本报告基于公开信息和AI分析生成，仅供参考，不构成投资建议。投资有风险，决策需谨慎。"""
 
 
+DEEP_RESEARCH_USER = """## 研究背景
+
+**研究标的:** {stock_name}
+**研究触发原因:** {trigger_reason}
+
+---
+
+## 第三部分：历史研究上下文
+
+{research_history}
+
+---
+
+## 第四部分：本次 Environment 变化
+
+{environment_changes}
+
+---
+
+## 第五部分：研究计划
+
+{research_plan}
+
+---
+
+## 第六部分：补充搜索结果
+
+{search_results}"""
+
+
+# import 时编译一次：渲染免去 .format 对 5KB 模板的逐次重新解析
+_SYSTEM_PARTS = compile_template(DEEP_RESEARCH_SYSTEM)
+_USER_PARTS = compile_template(DEEP_RESEARCH_USER)
+
+
 class ResearchEngine:
     """Deep Research 执行引擎"""
 
     def __init__(self, client: OpenAIClient, storage: Storage):
         self.client = client
         self.storage = storage
+        # (name -> (playbook 版本, 渲染结果))：同一标的连续研究时
+        # playbook 很少变，按版本复用 indent=2 的序列化结果
+        self._dumps_cache: Dict[str, Tuple[object, str]] = {}
+        # SearchManager 首次搜索时构建并跨研究复用（懒加载而非 __init__
+        # 直建：provider 探测 gateway 配置有 I/O，纯 LLM 路径用不到）
+        self._sm: Optional[SearchManager] = None
+
+    def _dumps_cached(self, name: str, version, obj: Optional[Dict]) -> str:
+        """按版本缓存的 json.dumps(..., indent=2)；空对象返回占位文案"""
+        if not obj:
+            return _EMPTY_PLAYBOOK_STR
+        cached = self._dumps_cache.get(name)
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        rendered = _json_dumps_pretty(obj)
+        self._dumps_cache[name] = (version, rendered)
+        return rendered
 
     def execute_research(
         self,
@@ -294,13 +370,17 @@ class ResearchEngine:
         search_results = self._execute_searches(research_plan, stock_playbook)
 
         # 格式化数据
-        portfolio_str = json.dumps(portfolio_playbook, ensure_ascii=False, indent=2) if portfolio_playbook else "（暂无）"
-        stock_playbook_str = json.dumps(stock_playbook, ensure_ascii=False, indent=2) if stock_playbook else "（暂无）"
+        portfolio_str = self._dumps_cached(
+            "portfolio", self.storage.get_portfolio_playbook_version(), portfolio_playbook
+        )
+        stock_playbook_str = self._dumps_cached(
+            f"stock:{stock_id}", self.storage.get_stock_playbook_version(stock_id), stock_playbook
+        )
 
         # 获取包含用户反馈的研究上下文
         research_context = self.storage.get_research_context(stock_id, limit=3)
 
-        history_str = "（暂无）"
+        history_str = _EMPTY_PLAYBOOK_STR
         if research_context:
             history_items = []
             for r in research_context:
@@ -339,7 +419,7 @@ class ResearchEngine:
             history_str = "\n".join(history_items)
 
         env_str = self._format_environment(environment_data)
-        plan_str = json.dumps(research_plan, ensure_ascii=False, indent=2)
+        plan_str = _json_dumps_pretty(research_plan)
 
         # 格式化历史上传文件
         historical_str = "（暂无历史上传资料）"
@@ -352,21 +432,24 @@ class ResearchEngine:
                 hist_items.append("")  # 空行分隔
             historical_str = "\n".join(hist_items)
 
-        # 调用 AI 执行研究
-        prompt = DEEP_RESEARCH_PROMPT.format(
-            stock_name=stock_name,
-            trigger_reason=research_plan.get("trigger_reason", ""),
-            portfolio_playbook=portfolio_str,
-            stock_playbook=stock_playbook_str,
-            user_preferences=user_preferences,
-            research_history=history_str,
-            environment_changes=env_str,
-            historical_uploads=historical_str,
-            research_plan=plan_str,
-            search_results=search_results
-        )
+        # 调用 AI 执行研究：慢变内容进 system（前缀缓存），本次动态内容进 user
+        system_prompt = _render_template(_SYSTEM_PARTS, {
+            "stock_name": stock_name,
+            "portfolio_playbook": portfolio_str,
+            "stock_playbook": stock_playbook_str,
+            "user_preferences": user_preferences,
+            "historical_uploads": historical_str,
+        })
+        user_prompt = _render_template(_USER_PARTS, {
+            "stock_name": stock_name,
+            "trigger_reason": research_plan.get("trigger_reason", ""),
+            "research_history": history_str,
+            "environment_changes": env_str,
+            "research_plan": plan_str,
+            "search_results": search_results,
+        })
 
-        response = self.client.chat(prompt)
+        response = self.client.chat_with_system(system_prompt, user_prompt)
 
         # 解析结论
         conclusion = self._extract_conclusion(response)
@@ -387,7 +470,7 @@ class ResearchEngine:
             "conclusion": conclusion,
             "key_findings": key_findings,
             "search_results": search_results,
-            "executed_at": datetime.now().isoformat()
+            "executed_at": _now_iso()
         }
 
     def _execute_searches(self, research_plan: Dict, playbook: Optional[Dict]) -> str:
@@ -401,21 +484,31 @@ class ResearchEngine:
         - 结果带缓存/预算，降低 SIGKILL 风险
         """
 
-        sm = SearchManager(
-            providers=[
-                TavilyProvider() if os.getenv("TAVILY_API_KEY") else None,
-                OpenClawWebSearchProvider(),
-            ],
-            cache_ttl_seconds=12 * 3600,
-            hard_timeout_seconds=25,
-        )
-
-        results: List[str] = []
+        if self._sm is None:
+            self._sm = SearchManager(
+                providers=[
+                    TavilyProvider() if os.getenv("TAVILY_API_KEY") else None,
+                    OpenClawWebSearchProvider(),
+                ],
+                cache_ttl_seconds=12 * 3600,
+                hard_timeout_seconds=25,
+            )
+        sm = self._sm
 
         def run_query(q: str) -> str:
             hits = sm.search(q, max_results=5, topic="news", depth="basic")
             return format_search_results_for_prompt(hits, limit=5)
 
+        # 两遍式：先走一遍计划收集文本骨架和全部 (位置, query)，
+        # 再把 query 并行派发。各 query 互相独立、纯网络等待，
+        # 串行执行的总耗时是 RTT 累加；线程池压到 ~max(RTT)。
+        parts: List[str] = []
+        tasks: List[Tuple[int, str]] = []  # (parts 下标, query)
+
+        def add_query(header: str, q: str) -> None:
+            parts.append(header)  # 先占位标题，搜索结果回填在其后
+            tasks.append((len(parts) - 1, q))
+
         research_modules = research_plan.get("research_modules", [])
         if research_modules:
             for module in research_modules:
@@ -423,77 +516,116 @@ class ResearchEngine:
                 search_queries = module.get("search_queries", [])
                 key_questions = module.get("key_questions", [])
 
-                results.append(f"\n## 📊 研究模块: {module_name}\n")
+                parts.append(f"\n## 📊 研究模块: {module_name}\n")
 
                 for query in (search_queries or [])[:3]:
-                    results.append(f"### 🔍 搜索: {query}\n{run_query(query)}\n")
+                    add_query(f"### 🔍 搜索: {query}\n", query)
 
                 if not search_queries and key_questions:
                     for q in key_questions[:2]:
-                        results.append(f"### 🔍 问题: {q}\n{run_query(q)}\n")
+                        add_query(f"### 🔍 问题: {q}\n", q)
 
-        if not results:
+        if not parts:
             hypotheses = research_plan.get("hypothesis_to_test", [])
             for h in hypotheses[:2]:
                 how_to_verify = (h.get("how_to_verify", "") or "").strip()
                 if how_to_verify:
-                    results.append(f"### 🔍 验证假设: {h.get('hypothesis', '')}\n{run_query(how_to_verify)}\n")
+                    add_query(f"### 🔍 验证假设: {h.get('hypothesis', '')}\n", how_to_verify)
 
-        if not results:
+        if not parts:
             objective = (research_plan.get("research_objective", "") or "").strip()
             if objective:
-                results.append(f"### 🔍 研究目标: {objective}\n{run_query(objective)}\n")
+                add_query(f"### 🔍 研究目标: {objective}\n", objective)
 
             questions = research_plan.get("core_questions", [])
             for q in questions[:3]:
-                results.append(f"### 🔍 {q}\n{run_query(q)}\n")
-
-        return "\n".join(results) if results else "（未执行搜索）"
+                add_query(f"### 🔍 {q}\n", q)
+
+        if tasks:
+            # 跨模块去重：多个模块常给出相同的 query（财务/竞争等套话），
+            # 规范化后每个 query 只真正执行一次，结果回填到所有引用位置
+            unique: Dict[str, Tuple[str, List[int]]] = {}
+            for idx, q in tasks:
+                entry = unique.get(q.strip().lower())
+                if entry is None:
+                    unique[q.strip().lower()] = (q, [idx])
+                else:
+                    entry[1].append(idx)
+
+            entries = list(unique.values())
+            # 按提交顺序消费结果，回填后输出顺序与串行版一致。
+            # 预算的作用是封顶 prompt 体积：超出后剩余段落标记省略，
+            # 即使查询已跑完也不再进 prompt。真正省墙钟时间的是最后的
+            # shutdown(cancel_futures=True)——还没开跑的查询直接取消，
+            # 在跑的不等收尾（with 块退出会 join 全部线程，故不用 with）
+            budget = _MAX_SEARCH_CHARS
+            pool = ThreadPoolExecutor(max_workers=min(8, len(entries)))
+            try:
+                futures = [pool.submit(run_query, q) for q, _ in entries]
+                for (_, indices), fut in zip(entries, futures):
+                    if budget <= 0:
+                        for idx in indices:
+                            parts[idx] = f"{parts[idx]}（搜索结果超出预算，本段省略）\n"
+                        continue
+                    text = fut.result()
+                    budget -= len(text)
+                    for idx in indices:
+                        parts[idx] = f"{parts[idx]}{text}\n"
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        return "\n".join(parts) if parts else _EMPTY_SEARCH_STR
 
     def _format_environment(self, environment_data: Dict) -> str:
-        """格式化 Environment 数据"""
-        lines = []
+        """格式化 Environment 数据（StringIO 累积，免去逐行小字符串对象）"""
+        if not environment_data:
+            return _EMPTY_ENV_STR
+        buf = io.StringIO()
 
         auto = environment_data.get("auto_collected", [])
         if auto:
-            lines.append("自动采集:")
+            buf.write("自动采集:")
             for item in auto:
-                lines.append(f"  - [{item.get('date', '')}] {item.get('title', '')}")
+                buf.write(f"\n  - [{item.get('date', '')}] {item.get('title', '')}")
 
         uploaded = environment_data.get("user_uploaded", [])
         if uploaded:
-            lines.append("\n用户上传:")
+            if auto:
+                buf.write("\n")
+            buf.write("\n用户上传:")
             for item in uploaded:
-                lines.append(f"  - {item.get('filename', '')}: {item.get('summary', '')[:100]}...")
+                buf.write(f"\n  - {item.get('filename', '')}: {item.get('summary', '')[:100]}...")
 
-        return "\n".join(lines) if lines else "（无变化数据）"
+        return buf.getvalue() or _EMPTY_ENV_STR
 
     def _extract_conclusion(self, response: str) -> Dict:
         """从响应中提取结论 JSON"""
         parse_error = None
 
-        # 尝试从 markdown code block 中提取
-        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
+        # 尝试从 markdown code block 中提取：取最后一个围栏块——
+        # 报告模板把结论 JSON 放在末尾（第八节），正文前段若还有
+        # 其它围栏块（示例/引用代码），首个匹配会拿错对象
+        json_match = None
+        for json_match in _CODE_BLOCK_RE.finditer(response):
+            pass
         if json_match:
             try:
-                result = json.loads(json_match.group(1))
+                result = _json_loads(json_match.group(1))
                 result["_parse_success"] = True
                 return result
-            except json.JSONDecodeError as e:
+            except ValueError as e:
                 parse_error = f"JSON 解析错误 (code block): {str(e)}"
                 self.storage.log(parse_error, "WARNING")
 
-        # 尝试查找更完整的 JSON 对象（包含嵌套）
-        # 从 "research_date" 或 "thesis_impact" 开始查找
-        json_pattern = r'\{[^{}]*(?:"research_date"|"thesis_impact")[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-        match = re.search(json_pattern, response)
-        if match:
+        # 线性扫描查找含结论标志字段的平衡 JSON 对象（支持任意嵌套）
+        candidate = _find_conclusion_json(response)
+        if candidate:
             try:
-                result = json.loads(match.group(0))
+                result = _json_loads(candidate)
                 result["_parse_success"] = True
                 return result
-            except json.JSONDecodeError as e:
-                parse_error = f"JSON 解析错误 (pattern match): {str(e)}"
+            except ValueError as e:
+                parse_error = f"JSON 解析错误 (balanced scan): {str(e)}"
                 self.storage.log(parse_error, "WARNING")
 
         # 返回默认结构，标记解析失败
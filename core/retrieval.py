@@ -13,20 +13,63 @@ Policy note (Peter requirement):
 from __future__ import annotations
 
 import hashlib
-import json
 import logging
 import os
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from utils.json_compat import loads as _json_loads, dumps as _json_dumps
 
 logger = logging.getLogger(__name__)
 
 CACHE_DIR = Path(os.getenv("INVEST_ASSISTANT_CACHE_DIR", os.path.expanduser("~/.investment-assistant/cache")))
 SEARCH_CACHE_DIR = CACHE_DIR / "search"
 
+# 进程内已反序列化结果的 LRU 上限（与 llm_cache 的内存层同一做法）
+_MEM_MAX_ENTRIES = 512
+
+# 只影响跟踪统计、不改变页面内容的 query 参数，去重时丢弃
+_TRACKING_PARAMS = ("gclid", "fbclid", "igshid", "mc_cid", "mc_eid")
+
+
+def _normalize_url(url: str) -> str:
+    """URL 归一化（仅用作去重键，不改写结果里的原始 URL）
+
+    scheme/host 小写、去末尾斜杠、去 fragment、去 utm_* 等跟踪参数；
+    这样 `https://X.com/a/?utm_source=rss` 和 `https://x.com/a`
+    不会在 union 合并里占两个名额。
+    """
+    u = (url or "").strip()
+    if not u:
+        return ""
+    try:
+        parts = urlsplit(u)
+        query = urlencode(
+            [
+                (k, v)
+                for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                if not k.startswith("utm_") and k not in _TRACKING_PARAMS
+            ]
+        )
+        return urlunsplit(
+            (
+                parts.scheme.lower(),
+                parts.netloc.lower(),
+                parts.path.rstrip("/"),
+                query,
+                "",  # fragment 只是页内锚点
+            )
+        )
+    except ValueError:
+        return u
+
 
 @dataclass
 class SearchResult:
@@ -105,6 +148,35 @@ class OpenClawWebSearchProvider(SearchProvider):
     def __init__(self, *, config_path: Optional[str] = None, session_key: str = "main"):
         self.session_key = session_key
         self._gateway_http_base, self._token = self._load_gateway_config(config_path=config_path)
+        self._session = None  # 首次调用时构建（requests 按需导入）
+
+    def _get_session(self):
+        """长生命周期 Session：keep-alive 复用 TCP 连接 + 自动重试瞬时错误
+
+        每次 requests.post 裸调都要新建连接（HTTPS 下还要多付一次 TLS
+        握手）；连续 union 搜索时这是纯开销。
+        """
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=8,
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.2,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    # tools/invoke 的 web_search 是幂等查询，POST 可安全重试
+                    allowed_methods=frozenset({"GET", "POST"}),
+                ),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
 
     def is_available(self) -> bool:
         return bool(self._gateway_http_base and self._token)
@@ -122,7 +194,7 @@ class OpenClawWebSearchProvider(SearchProvider):
             return "", ""
 
         try:
-            data = json.loads(path.read_text("utf-8"))
+            data = _json_loads(path.read_bytes())
         except Exception:
             return "", ""
 
@@ -150,8 +222,6 @@ class OpenClawWebSearchProvider(SearchProvider):
         return "http://" + u
 
     def _invoke_tool(self, tool: str, args: Dict[str, Any]) -> Dict[str, Any]:
-        import requests
-
         url = f"{self._gateway_http_base}/tools/invoke"
         headers = {
             "Authorization": f"Bearer {self._token}",
@@ -162,9 +232,10 @@ class OpenClawWebSearchProvider(SearchProvider):
             "args": args,
             "sessionKey": self.session_key,
         }
-        r = requests.post(url, headers=headers, json=payload, timeout=25)
+        r = self._get_session().post(url, headers=headers, json=payload, timeout=25)
         r.raise_for_status()
-        obj = r.json()
+        # 走 json_compat（orjson 可用时吃 bytes，免一次文本解码）
+        obj = _json_loads(r.content)
         if not obj.get("ok", False):
             err = obj.get("error") or {}
             raise RuntimeError(f"OpenClaw tool invoke failed: {err.get('type')}: {err.get('message')}")
@@ -179,7 +250,7 @@ class OpenClawWebSearchProvider(SearchProvider):
             if isinstance(content, list) and content and isinstance(content[0], dict):
                 text = content[0].get("text")
                 if isinstance(text, str) and text.strip().startswith("{"):
-                    return json.loads(text)
+                    return _json_loads(text)
         except Exception:
             pass
         return result
@@ -223,6 +294,7 @@ class SearchManager:
         *,
         cache_ttl_seconds: int = 12 * 3600,
         hard_timeout_seconds: int = 25,
+        neg_ttl_seconds: int = 60,
     ):
         self.providers: List[SearchProvider] = list(providers) if providers is not None else [
             TavilyProvider() if os.getenv("TAVILY_API_KEY") else None,
@@ -231,40 +303,108 @@ class SearchManager:
         self.providers = [p for p in self.providers if p is not None]
         self.cache_ttl_seconds = cache_ttl_seconds
         self.hard_timeout_seconds = hard_timeout_seconds
+        # provider 抛错后的负缓存窗口：短 TTL 内同一 query 不再吃一轮超时
+        self.neg_ttl_seconds = neg_ttl_seconds
+        # 写缓存先进脏表，search() 结尾一次性刷盘：union + 各 provider
+        # 的写合并成一轮文件 IO。不注册 atexit 兜底——每次 search 都会
+        # 刷盘，脏表只在调用中间短暂非空，而 atexit 会把实例钉到进程
+        # 退出（长驻 Web 进程里每次新建 manager 都泄掉一个内存 LRU）
+        self._dirty: Dict[str, Dict] = {}
+        # 进程内 LRU：重复 query 连磁盘读 + JSON 解析 + dataclass 重建
+        # 都省掉。research 的搜索 fan-out 会从多线程打进来，所以带锁
+        self._mem_cache: "OrderedDict[str, Tuple[float, List[SearchResult]]]" = OrderedDict()
+        self._mem_lock = threading.Lock()
+        # 同一 union key 的并发未命中只打一轮 provider，其余等结果
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
 
     def _cache_key(self, query: str, provider: str, max_results: int, topic: str, depth: str) -> str:
-        raw = json.dumps({"q": query, "p": provider, "n": max_results, "topic": topic, "depth": depth}, sort_keys=True)
-        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        # 字段顺序固定，无需 sort_keys（与 llm_cache.make_key 同一做法）
+        raw = _json_dumps({"q": query, "p": provider, "n": max_results, "topic": topic, "depth": depth})
+        # 缓存键只做内容寻址，不需要抗碰撞攻击，blake2b-128 足够且更快
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
 
     def _cache_path(self, key: str) -> Path:
         SEARCH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
         return SEARCH_CACHE_DIR / f"{key}.json"
 
+    def _mem_get(self, key: str) -> Optional[List[SearchResult]]:
+        with self._mem_lock:
+            hit = self._mem_cache.get(key)
+            if hit is None:
+                return None
+            expires_at, results = hit
+            if time.time() > expires_at:
+                del self._mem_cache[key]
+                return None
+            self._mem_cache.move_to_end(key)
+            # 浅拷贝：调用方可能截断/拼接返回列表，不能让它改到缓存本体
+            return list(results)
+
+    def _mem_put(self, key: str, expires_at: float, results: List[SearchResult]) -> None:
+        with self._mem_lock:
+            self._mem_cache[key] = (expires_at, results)
+            self._mem_cache.move_to_end(key)
+            while len(self._mem_cache) > _MEM_MAX_ENTRIES:
+                self._mem_cache.popitem(last=False)
+
     def _read_cache(self, key: str) -> Optional[List[SearchResult]]:
-        p = self._cache_path(key)
-        if not p.exists():
-            return None
+        cached = self._mem_get(key)
+        if cached is not None:
+            return cached
+
+        obj = self._dirty.get(key)
+        if obj is None:
+            p = self._cache_path(key)
+            if not p.exists():
+                return None
         try:
-            obj = json.loads(p.read_text("utf-8"))
+            if obj is None:
+                obj = _json_loads(p.read_bytes())
             ts = obj.get("ts")
-            if ts and (time.time() - float(ts)) > self.cache_ttl_seconds:
+            # 负缓存条目（provider 出错时写入）用更短的 TTL
+            ttl = self.neg_ttl_seconds if obj.get("error") else self.cache_ttl_seconds
+            if ts and (time.time() - float(ts)) > ttl:
                 return None
             items = obj.get("results") or []
-            out: List[SearchResult] = []
-            for it in items:
-                out.append(SearchResult(**it))
-            return out
+            make = SearchResult
+            results = [make(**it) for it in items]
+            self._mem_put(key, (float(ts) if ts else time.time()) + ttl, results)
+            return list(results)
         except Exception:
             return None
 
-    def _write_cache(self, key: str, results: List[SearchResult]) -> None:
-        p = self._cache_path(key)
+    def _write_cache(self, key: str, results: List[SearchResult], *, error: Optional[str] = None) -> None:
+        now = time.time()
         payload = {
-            "ts": time.time(),
+            "ts": now,
             "saved_at": datetime.now(timezone.utc).isoformat(),
             "results": [r.__dict__ for r in results],
         }
-        p.write_text(json.dumps(payload, ensure_ascii=False, indent=2), "utf-8")
+        if error is not None:
+            payload["error"] = error
+        # 与 _flush_dirty 的整表换出同一把锁：不加锁的话，拿着旧表引用的
+        # 写入会撞上刷盘迭代（RuntimeError）或落在迭代后被静默丢弃
+        with self._mem_lock:
+            self._dirty[key] = payload
+        # 同步进内存层：紧随其后的 union 查找 / 重复 query 零成本命中
+        ttl = self.neg_ttl_seconds if error is not None else self.cache_ttl_seconds
+        self._mem_put(key, now + ttl, list(results))
+
+    def _flush_dirty(self) -> None:
+        """把脏表里的条目批量落盘并清空"""
+        # 先整表换出再迭代：并发 search 在刷盘中途写入脏表也不会炸迭代
+        with self._mem_lock:
+            if not self._dirty:
+                return
+            batch = self._dirty
+            self._dirty = {}
+        for key, payload in batch.items():
+            try:
+                # 紧凑输出：缓存文件只有机器读，indent 只是白费序列化和磁盘
+                self._cache_path(key).write_text(_json_dumps(payload), "utf-8")
+            except Exception as exc:
+                logger.debug("search cache flush failed for %s: %s", key, exc)
 
     def search(self, query: str, *, max_results: int = 5, topic: str = "news", depth: str = "basic") -> List[SearchResult]:
         """Search using all available providers and merge results.
@@ -272,9 +412,14 @@ class SearchManager:
         Peter requirement: use Tavily + Brave together (union) to improve recall.
 
         Strategy:
-        - For each provider: try cache; else call provider.
-        - Merge by URL, keep first-seen order (provider order), cap to max_results.
+        - For each provider: try cache; dispatch all cache misses in parallel
+          (providers are independent network calls, so wall time is the
+          slowest provider, not the sum).
+        - Merge by URL in original provider order (first-seen semantics
+          unchanged), cap to max_results.
         - Cache the merged results under a stable key (provider="union").
+        - Coalesce concurrent identical misses: only the first caller hits
+          the providers, the rest wait on its in-flight Future.
         """
 
         start = time.time()
@@ -284,31 +429,88 @@ class SearchManager:
         if cached_union is not None:
             return cached_union
 
-        merged: List[SearchResult] = []
-        seen_urls = set()
-
-        for provider in self.providers:
-            if (time.time() - start) > self.hard_timeout_seconds:
-                break
-            if not provider.is_available():
-                continue
+        with self._inflight_lock:
+            fut = self._inflight.get(union_key)
+            if fut is None:
+                fut = Future()
+                self._inflight[union_key] = fut
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # 搭已有请求的便车；拷贝一份防止多个调用方改到同一列表。
+            # search() 对调用方从不抛错（provider 故障向来降级为空/部分
+            # 结果），等待方超时或 owner 出错时也保持同一语义
+            try:
+                return list(fut.result(timeout=self.hard_timeout_seconds))
+            except Exception as exc:
+                logger.warning("Coalesced search failed for query %r: %s", query, exc)
+                return []
 
+        try:
+            merged = self._search_providers(
+                query, max_results=max_results, topic=topic, depth=depth, start=start
+            )
+            self._write_cache(union_key, merged)
+            self._flush_dirty()
+            fut.set_result(merged)
+            return merged
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(union_key, None)
+
+    def _search_providers(
+        self, query: str, *, max_results: int, topic: str, depth: str, start: float
+    ) -> List[SearchResult]:
+        """对所有可用 provider 做缓存预检 + 并行派发 + union 合并"""
+        available = [p for p in self.providers if p.is_available()]
+
+        # 先收缓存命中，未命中的记下来并行派发
+        hits: Dict[int, List[SearchResult]] = {}
+        pending: List[Tuple[int, SearchProvider, str]] = []
+        for i, provider in enumerate(available):
             ck = self._cache_key(query, provider.name, max_results, topic, depth)
             cached = self._read_cache(ck)
-            res: List[SearchResult]
             if cached is not None:
-                res = cached
+                hits[i] = cached
             else:
+                pending.append((i, provider, ck))
+
+        if pending:
+            pool = ThreadPoolExecutor(max_workers=len(pending))
+            futures = {
+                pool.submit(p.search, query, max_results=max_results, topic=topic, depth=depth): (i, p, ck)
+                for i, p, ck in pending
+            }
+            budget = self.hard_timeout_seconds - (time.time() - start)
+            done, not_done = wait(futures, timeout=max(0.0, budget))
+            for fut in done:
+                i, provider, ck = futures[fut]
                 try:
-                    res = provider.search(query, max_results=max_results, topic=topic, depth=depth)
-                    if res:
-                        self._write_cache(ck, res)
+                    res = fut.result()
                 except Exception as exc:
                     logger.warning("Search provider %s failed for query %r: %s", provider.name, query, exc)
+                    # 负缓存：neg_ttl 窗口内同一 query 直接拿空结果
+                    self._write_cache(ck, [], error=str(exc))
                     continue
+                if res:
+                    self._write_cache(ck, res)
+                hits[i] = res
+            for fut in not_done:
+                provider = futures[fut][1]
+                logger.warning("Search provider %s timed out for query %r", provider.name, query)
+            # 不等超时的 provider 线程收尾；墙钟预算优先于线程回收
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            for r in res:
-                u = (r.url or "").strip()
+        merged: List[SearchResult] = []
+        seen_urls = set()
+        for i in range(len(available)):
+            for r in hits.get(i) or []:
+                u = _normalize_url(r.url)
                 if not u or u in seen_urls:
                     continue
                 seen_urls.add(u)
@@ -318,7 +520,6 @@ class SearchManager:
             if len(merged) >= max_results:
                 break
 
-        self._write_cache(union_key, merged)
         return merged
 
 
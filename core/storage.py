@@ -1,12 +1,13 @@
 """数据存储模块"""
 
-import json
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 import shutil
 
+from utils.json_compat import loads as _json_loads, dumps_pretty as _json_dumps_pretty
+
 
 class Storage:
     """本地 JSON 文件存储"""
@@ -23,19 +24,42 @@ class Storage:
         self.config_path = self.base_dir / "config.json"
         self.portfolio_playbook_path = self.base_dir / "portfolio_playbook.json"
 
+        # Playbook 读缓存：path -> ((mtime_ns, size), parsed)
+        # list_stocks / 环境检查会反复读同一批 playbook，
+        # 文件未变时跳过重新打开+解析，只剩一次 stat
+        self._playbook_cache: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+
+    def _read_playbook_cached(self, path: Path) -> Optional[Dict]:
+        """按 (mtime_ns, size) 缓存的 JSON 读取；文件不存在返回 None"""
+        try:
+            st = path.stat()
+        except OSError:
+            self._playbook_cache.pop(str(path), None)
+            return None
+
+        stat_key = (st.st_mtime_ns, st.st_size)
+        cached = self._playbook_cache.get(str(path))
+        if cached and cached[0] == stat_key:
+            return cached[1]
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = _json_loads(f.read())
+        self._playbook_cache[str(path)] = (stat_key, data)
+        return data
+
     # ==================== 配置 ====================
 
     def get_config(self) -> Dict:
         """获取配置"""
         if self.config_path.exists():
             with open(self.config_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+                return _json_loads(f.read())
         return {}
 
     def save_config(self, config: Dict):
         """保存配置"""
         with open(self.config_path, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+            f.write(_json_dumps_pretty(config))
 
     def get_api_key(self) -> Optional[str]:
         """获取 API Key（OpenAI 优先，兼容旧版 Gemini 配置）"""
@@ -56,10 +80,7 @@ class Storage:
 
     def get_portfolio_playbook(self) -> Optional[Dict]:
         """获取总体 Playbook"""
-        if self.portfolio_playbook_path.exists():
-            with open(self.portfolio_playbook_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return None
+        return self._read_playbook_cached(self.portfolio_playbook_path)
 
     def save_portfolio_playbook(self, playbook: Dict):
         """保存总体 Playbook"""
@@ -68,12 +89,23 @@ class Storage:
             playbook["created_at"] = playbook["updated_at"]
 
         with open(self.portfolio_playbook_path, "w", encoding="utf-8") as f:
-            json.dump(playbook, f, ensure_ascii=False, indent=2)
+            f.write(_json_dumps_pretty(playbook))
 
     def has_portfolio_playbook(self) -> bool:
         """检查是否已有总体 Playbook"""
         return self.portfolio_playbook_path.exists()
 
+    def get_portfolio_playbook_version(self) -> Optional[Tuple[float, int]]:
+        """总体 Playbook 的版本标识 (mtime, size)；文件不存在返回 None
+
+        供调用方做缓存失效判断，避免每次重新读取/序列化整个文件。
+        """
+        try:
+            st = self.portfolio_playbook_path.stat()
+            return (st.st_mtime, st.st_size)
+        except OSError:
+            return None
+
     # ==================== 个股 Playbook ====================
 
     def _get_stock_dir(self, stock_id: str) -> Path:
@@ -85,11 +117,15 @@ class Storage:
 
     def get_stock_playbook(self, stock_id: str) -> Optional[Dict]:
         """获取个股 Playbook"""
-        playbook_path = self._get_stock_dir(stock_id) / "playbook.json"
-        if playbook_path.exists():
-            with open(playbook_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return None
+        return self._read_playbook_cached(self._get_stock_dir(stock_id) / "playbook.json")
+
+    def get_stock_playbook_version(self, stock_id: str) -> Optional[Tuple[int, int]]:
+        """个股 Playbook 的版本标识 (mtime_ns, size)；文件不存在返回 None"""
+        try:
+            st = (self._get_stock_dir(stock_id) / "playbook.json").stat()
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
 
     def save_stock_playbook(self, stock_id: str, playbook: Dict):
         """保存个股 Playbook"""
@@ -100,7 +136,7 @@ class Storage:
 
         playbook_path = self._get_stock_dir(stock_id) / "playbook.json"
         with open(playbook_path, "w", encoding="utf-8") as f:
-            json.dump(playbook, f, ensure_ascii=False, indent=2)
+            f.write(_json_dumps_pretty(playbook))
 
     def list_stocks(self) -> List[Dict]:
         """列出所有股票"""
@@ -120,6 +156,30 @@ class Storage:
                         })
         return stocks
 
+    def find_stock(self, query: str) -> Optional[str]:
+        """按子串模糊查找 stock_id
+
+        先在目录名上匹配（零文件读取），未命中再回退到展示名匹配
+        （list_stocks 读 playbook，但命中缓存时同样只剩 stat）。
+        """
+        q = query.lower()
+        stocks_dir = self.base_dir / "stocks"
+        if not stocks_dir.exists():
+            return None
+        names = [d.name for d in stocks_dir.iterdir() if d.is_dir()]
+        # 绝大多数输入就是规范名：先做整串相等（目录名即规范化 id），
+        # 命中则完全跳过子串扫描
+        qid = q.replace(" ", "_")
+        if qid in names:
+            return qid
+        for name in names:
+            if q in name:
+                return name
+        for s in self.list_stocks():
+            if q in s["stock_name"].lower():
+                return s["stock_id"]
+        return None
+
     def delete_stock(self, stock_id: str) -> bool:
         """删除股票"""
         stock_dir = self._get_stock_dir(stock_id)
@@ -135,22 +195,23 @@ class Storage:
         history_path = self._get_stock_dir(stock_id) / "history.json"
         if history_path.exists():
             with open(history_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+                return _json_loads(f.read())
         return {"stock_id": stock_id, "records": []}
 
     def add_research_record(self, stock_id: str, record: Dict):
         """添加研究记录"""
         history = self.get_research_history(stock_id)
 
-        # 生成 ID
-        record["id"] = f"research_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        record["date"] = datetime.now().isoformat()
+        # 生成 ID（now 取一次，id/date 保证来自同一时刻）
+        now = datetime.now()
+        record["id"] = f"research_{now.strftime('%Y%m%d_%H%M%S')}"
+        record["date"] = now.isoformat()
 
         history["records"].insert(0, record)  # 新记录放在最前面
 
         history_path = self._get_stock_dir(stock_id) / "history.json"
         with open(history_path, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+            f.write(_json_dumps_pretty(history))
 
     def get_recent_research(self, stock_id: str, limit: int = 3) -> List[Dict]:
         """获取最近的研究记录（包含里程碑记录）"""
@@ -186,7 +247,7 @@ class Storage:
 
                 history_path = self._get_stock_dir(stock_id) / "history.json"
                 with open(history_path, "w", encoding="utf-8") as f:
-                    json.dump(history, f, ensure_ascii=False, indent=2)
+                    f.write(_json_dumps_pretty(history))
                 return record["is_milestone"]
 
         return False
@@ -216,7 +277,7 @@ class Storage:
 
                 history_path = self._get_stock_dir(stock_id) / "history.json"
                 with open(history_path, "w", encoding="utf-8") as f:
-                    json.dump(history, f, ensure_ascii=False, indent=2)
+                    f.write(_json_dumps_pretty(history))
                 return True
 
         return False
@@ -317,7 +378,7 @@ class Storage:
         path = self._get_preferences_path()
         if path.exists():
             with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+                return _json_loads(f.read())
         return {
             "preferences": [],
             "preference_summary": {
@@ -334,7 +395,7 @@ class Storage:
         """保存用户偏好"""
         prefs["updated_at"] = datetime.now().isoformat()
         with open(self._get_preferences_path(), "w", encoding="utf-8") as f:
-            json.dump(prefs, f, ensure_ascii=False, indent=2)
+            f.write(_json_dumps_pretty(prefs))
 
     def add_preference(self, preference: Dict) -> str:
         """添加一条偏好记录"""
@@ -351,6 +412,34 @@ class Storage:
         self.save_user_preferences(prefs)
         return pref_id
 
+    def add_preferences_bulk(self, preferences: List[Dict]) -> List[str]:
+        """批量添加偏好：整批只做一次 读取-插入-落盘
+
+        逐条 add_preference 时每条都要完整读改写一遍偏好文件，
+        批量提取（偏好学习一次常产出多条）下是 N 倍的解析和写盘。
+        """
+        if not preferences:
+            return []
+
+        prefs = self.get_user_preferences()
+        now = datetime.now()
+        stamp = now.strftime("%Y%m%d_%H%M%S")
+        created = now.isoformat()
+        base = len(prefs["preferences"])
+
+        ids: List[str] = []
+        for i, preference in enumerate(preferences):
+            pref_id = f"pref_{stamp}_{base + i}"
+            preference["id"] = pref_id
+            preference["created_at"] = created
+            preference["updated_at"] = created
+            preference["active"] = True
+            prefs["preferences"].insert(0, preference)
+            ids.append(pref_id)
+
+        self.save_user_preferences(prefs)
+        return ids
+
     def update_preference(self, pref_id: str, updates: Dict) -> bool:
         """更新偏好"""
         prefs = self.get_user_preferences()
@@ -401,8 +490,9 @@ class Storage:
         """记录用户交互（用于偏好提取）"""
         prefs = self.get_user_preferences()
 
-        interaction["timestamp"] = datetime.now().isoformat()
-        interaction["id"] = f"int_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        now = datetime.now()
+        interaction["timestamp"] = now.isoformat()
+        interaction["id"] = f"int_{now.strftime('%Y%m%d_%H%M%S')}"
 
         prefs["interaction_log"].insert(0, interaction)
 
@@ -451,7 +541,8 @@ class Storage:
 
     def log(self, message: str, level: str = "INFO"):
         """写入日志"""
-        log_file = self.base_dir / "logs" / f"{datetime.now().strftime('%Y-%m-%d')}.log"
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        now = datetime.now()
+        log_file = self.base_dir / "logs" / f"{now.strftime('%Y-%m-%d')}.log"
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
         with open(log_file, "a", encoding="utf-8") as f:
             f.write(f"[{timestamp}] [{level}] {message}\n")
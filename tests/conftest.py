@@ -11,6 +11,20 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 
+# ---------------------------------------------------------------------------
+# Cache isolation
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(autouse=True)
+def _isolated_llm_cache(tmp_path: Path, monkeypatch):
+    """Point the on-disk LLM cache at a per-test directory (never the real home)."""
+    import core.llm_cache as llm_cache
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_DIR", tmp_path / "llm-cache")
+    llm_cache.clear_memory()
+    yield
+    llm_cache.clear_memory()
+
+
 # ---------------------------------------------------------------------------
 # Mock OpenAI client
 # ---------------------------------------------------------------------------
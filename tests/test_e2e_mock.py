@@ -18,6 +18,13 @@ def _fake_response(content: str):
     return resp
 
 
+def _fake_stream(content: str):
+    """Streaming response: one delta chunk carrying the full content."""
+    chunk = MagicMock()
+    chunk.choices[0].delta.content = content
+    return iter([chunk])
+
+
 class TestE2EMock:
     """Simulates: create playbooks -> collect news -> assess impact -> execute research."""
 
@@ -60,8 +67,8 @@ class TestE2EMock:
             })
 
             mock_instance.chat.completions.create.side_effect = [
-                # assess_impact calls chat once
-                _fake_response(f"```json\n{assess_json}\n```"),
+                # assess_impact consumes a stream
+                _fake_stream(f"```json\n{assess_json}\n```"),
                 # execute_research calls chat once
                 _fake_response(f"# Report\n\n```json\n{research_json}\n```"),
             ]
@@ -0,0 +1,145 @@
+"""Tests for core.llm_cache (key derivation, TTL, memory LRU, disk round-trip)."""
+
+from __future__ import annotations
+
+import time
+from unittest.mock import patch
+
+import pytest
+
+from core import llm_cache
+from utils.json_compat import loads, dumps
+
+
+_MSGS = [{"role": "user", "content": "hello"}]
+
+
+# ---------------------------------------------------------------------------
+# make_key
+# ---------------------------------------------------------------------------
+
+class TestMakeKey:
+    def test_stable(self):
+        assert llm_cache.make_key("m", _MSGS) == llm_cache.make_key("m", _MSGS)
+
+    def test_sensitive_to_model(self):
+        assert llm_cache.make_key("m1", _MSGS) != llm_cache.make_key("m2", _MSGS)
+
+    def test_sensitive_to_messages(self):
+        other = [{"role": "user", "content": "hello!"}]
+        assert llm_cache.make_key("m", _MSGS) != llm_cache.make_key("m", other)
+
+    def test_sensitive_to_extra(self):
+        base = llm_cache.make_key("m", _MSGS)
+        with_extra = llm_cache.make_key("m", _MSGS, extra={"response_format": {"type": "json_object"}})
+        assert base != with_extra
+
+    def test_empty_extra_keeps_legacy_key(self):
+        # extra=None / extra={} 不进 payload，与旧版 key 兼容
+        base = llm_cache.make_key("m", _MSGS)
+        assert llm_cache.make_key("m", _MSGS, extra=None) == base
+        assert llm_cache.make_key("m", _MSGS, extra={}) == base
+
+
+# ---------------------------------------------------------------------------
+# get / put
+# ---------------------------------------------------------------------------
+
+class TestGetPut:
+    def test_miss_returns_none(self):
+        assert llm_cache.get("no-such-key") is None
+
+    def test_round_trip_memory(self):
+        key = llm_cache.make_key("m", _MSGS)
+        llm_cache.put(key, "cached response")
+        assert llm_cache.get(key) == "cached response"
+
+    def test_round_trip_disk(self):
+        # 清掉内存层后仍能从磁盘命中（跨进程场景）
+        key = llm_cache.make_key("m", _MSGS)
+        llm_cache.put(key, "persisted")
+        llm_cache.clear_memory()
+        assert llm_cache.get(key) == "persisted"
+
+    def test_ttl_expiry(self):
+        key = llm_cache.make_key("m", _MSGS)
+        llm_cache.put(key, "stale")
+        # 把磁盘条目的 ts 拨旧 100s，内存层清空后按磁盘 ts 判定
+        path = llm_cache.LLM_CACHE_DIR / f"{key}.json"
+        entry = loads(path.read_text(encoding="utf-8"))
+        entry["ts"] = time.time() - 100
+        path.write_text(dumps(entry), encoding="utf-8")
+        llm_cache.clear_memory()
+        assert llm_cache.get(key, ttl_seconds=50) is None
+        assert llm_cache.get(key, ttl_seconds=1000) == "stale"
+
+    def test_corrupted_entry_returns_none_and_is_deleted(self):
+        key = "deadbeef"
+        llm_cache.LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = llm_cache.LLM_CACHE_DIR / f"{key}.json"
+        path.write_text("{not json", encoding="utf-8")
+        assert llm_cache.get(key) is None
+        assert not path.exists()
+
+    def test_expired_entry_deleted_from_disk(self):
+        key = "expired"
+        llm_cache.put(key, "old")
+        path = llm_cache.LLM_CACHE_DIR / f"{key}.json"
+        entry = loads(path.read_text(encoding="utf-8"))
+        entry["ts"] = time.time() - llm_cache.DEFAULT_TTL_SECONDS - 10
+        path.write_text(dumps(entry), encoding="utf-8")
+        llm_cache.clear_memory()
+        assert llm_cache.get(key) is None
+        assert not path.exists()
+
+    def test_short_ttl_read_keeps_disk_entry(self):
+        # 调用方传短 TTL 时条目对默认 TTL 的其它调用方仍有效，不应删
+        key = "fresh-ish"
+        llm_cache.put(key, "v")
+        path = llm_cache.LLM_CACHE_DIR / f"{key}.json"
+        entry = loads(path.read_text(encoding="utf-8"))
+        entry["ts"] = time.time() - 100
+        path.write_text(dumps(entry), encoding="utf-8")
+        llm_cache.clear_memory()
+        assert llm_cache.get(key, ttl_seconds=50) is None
+        assert path.exists()
+        assert llm_cache.get(key) == "v"
+
+    def test_disk_eviction_caps_entry_count(self, monkeypatch):
+        import os
+        monkeypatch.setattr(llm_cache, "_DISK_MAX_ENTRIES", 3)
+        llm_cache.LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for i in range(5):
+            path = llm_cache.LLM_CACHE_DIR / f"k{i}.json"
+            path.write_text(dumps({"ts": time.time(), "response": "v"}), encoding="utf-8")
+            os.utime(path, (1000 + i, 1000 + i))
+        llm_cache._evict_disk_overflow()
+        remaining = sorted(p.name for p in llm_cache.LLM_CACHE_DIR.glob("*.json"))
+        assert remaining == ["k2.json", "k3.json", "k4.json"]
+
+    def test_memory_lru_eviction(self, monkeypatch):
+        monkeypatch.setattr(llm_cache, "_MEM_MAX_ENTRIES", 2)
+        for i in range(3):
+            llm_cache.put(f"k{i}", f"v{i}")
+        with llm_cache._mem_lock:
+            assert "k0" not in llm_cache._mem_cache
+            assert set(llm_cache._mem_cache) == {"k1", "k2"}
+        # 被逐出内存的条目仍可从磁盘读回
+        assert llm_cache.get("k0") == "v0"
+
+
+# ---------------------------------------------------------------------------
+# OpenAIClient integration (cache hit / skip_cache)
+# ---------------------------------------------------------------------------
+
+class TestChatCaching:
+    def test_repeat_chat_hits_cache(self, mock_openai_client):
+        first = mock_openai_client.chat("same prompt")
+        second = mock_openai_client.chat("same prompt")
+        assert first == second == "mock response"
+        assert mock_openai_client.client.chat.completions.create.call_count == 1
+
+    def test_skip_cache_forces_refresh(self, mock_openai_client):
+        mock_openai_client.chat("same prompt")
+        mock_openai_client.chat("same prompt", skip_cache=True)
+        assert mock_openai_client.client.chat.completions.create.call_count == 2
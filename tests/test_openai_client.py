@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import json
 import os
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -70,13 +71,163 @@ class TestSearch:
         assert "[search disabled]" in result
 
 
+# ---------------------------------------------------------------------------
+# _simhash64 / _dedupe_news
+# ---------------------------------------------------------------------------
+
+_LONG_TITLE = "英伟达发布新一代数据中心芯片，性能较上一代提升一倍，云厂商需求强劲"
+
+
+class TestSimHash:
+    def test_identical_text_same_fingerprint(self):
+        from core.openai_client import _simhash64
+        assert _simhash64(_LONG_TITLE) == _simhash64(_LONG_TITLE)
+
+    def test_near_duplicate_within_threshold(self):
+        from core.openai_client import _simhash64
+        d = (_simhash64(_LONG_TITLE) ^ _simhash64(_LONG_TITLE + "！")).bit_count()
+        assert d <= 6
+
+    def test_distinct_titles_far_apart(self):
+        from core.openai_client import _simhash64
+        other = "美联储宣布维持利率不变，市场预期九月降息概率上升"
+        d = (_simhash64(_LONG_TITLE) ^ _simhash64(other)).bit_count()
+        assert d > 6
+
+
+class TestDedupeNews:
+    def test_exact_duplicate_removed(self):
+        from core.openai_client import _dedupe_news
+        out = _dedupe_news([
+            {"title": "茅台宣布涨价", "importance": "低"},
+            {"title": "茅台宣布涨价", "importance": "高"},
+        ])
+        assert len(out) == 1
+
+    def test_media_suffix_treated_as_same_title(self):
+        from core.openai_client import _dedupe_news
+        out = _dedupe_news([
+            {"title": "特斯拉上海工厂产能翻番 - 新浪财经", "importance": "中"},
+            {"title": "特斯拉上海工厂产能翻番 | Reuters", "importance": "中"},
+        ])
+        assert len(out) == 1
+
+    def test_near_duplicate_keeps_higher_importance(self):
+        from core.openai_client import _dedupe_news
+        out = _dedupe_news([
+            {"title": _LONG_TITLE, "importance": "低"},
+            {"title": _LONG_TITLE + "！", "importance": "高"},
+        ])
+        assert len(out) == 1
+        assert out[0]["importance"] == "高"
+
+    def test_distinct_short_titles_both_kept(self):
+        # 误杀保护：两条不相关短标题不能被 SimHash 合并
+        from core.openai_client import _dedupe_news
+        out = _dedupe_news([
+            {"title": "茅台宣布涨价", "importance": "中"},
+            {"title": "宁德时代扩产", "importance": "中"},
+        ])
+        assert len(out) == 2
+
+    def test_empty_titles_dropped(self):
+        from core.openai_client import _dedupe_news
+        out = _dedupe_news([{"title": "", "importance": "高"}, {"importance": "低"}])
+        assert out == []
+
+
+# ---------------------------------------------------------------------------
+# analyze_file / analyze_files
+# ---------------------------------------------------------------------------
+
+class TestAnalyzeFile:
+    def test_text_file_goes_through_chat(self, mock_openai_client, tmp_path):
+        f = tmp_path / "notes.md"
+        f.write_text("文件正文内容", "utf-8")
+        with patch.object(mock_openai_client, "chat", return_value="analyzed") as chat:
+            result = mock_openai_client.analyze_file(str(f), "请分析")
+        assert result == "analyzed"
+        prompt = chat.call_args[0][0]
+        assert "notes.md" in prompt
+        assert "文件正文内容" in prompt
+
+    def test_unsupported_extension(self, mock_openai_client, tmp_path):
+        f = tmp_path / "a.exe"
+        f.write_bytes(b"\x00")
+        assert "不支持的文件类型" in mock_openai_client.analyze_file(str(f), "p")
+
+    def test_image_inlined_as_base64(self, mock_openai_client, tmp_path):
+        import base64
+        raw = b"\x89PNG\r\n\x1a\nfakepixels"
+        f = tmp_path / "chart.png"
+        f.write_bytes(raw)
+
+        result = mock_openai_client.analyze_file(str(f), "图里说了什么")
+        assert result == "mock response"
+
+        call = mock_openai_client.client.chat.completions.create.call_args
+        content = call.kwargs["messages"][0]["content"]
+        assert content[0]["type"] == "image_url"
+        url = content[0]["image_url"]["url"]
+        assert url.startswith("data:image/png;base64,")
+        assert base64.b64decode(url.split(",", 1)[1]) == raw
+        assert content[1] == {"type": "text", "text": "图里说了什么"}
+
+    def test_pdf_uses_files_api(self, mock_openai_client, tmp_path):
+        f = tmp_path / "report.pdf"
+        f.write_bytes(b"%PDF-1.4 fake")
+        mock_openai_client.client.files.create.return_value = MagicMock(id="file-123")
+
+        mock_openai_client.analyze_file(str(f), "总结")
+
+        assert mock_openai_client.client.files.create.call_count == 1
+        call = mock_openai_client.client.chat.completions.create.call_args
+        content = call.kwargs["messages"][0]["content"]
+        assert content[0] == {"type": "file", "file": {"file_id": "file-123"}}
+
+    def test_large_file_streams_upload(self, mock_openai_client, tmp_path, monkeypatch):
+        # 压低阈值代替真写 20MB；超限图片也应走 Files API 而非 base64 内嵌
+        monkeypatch.setattr("core.openai_client._UPLOAD_THRESHOLD_BYTES", 10)
+        f = tmp_path / "huge.png"
+        f.write_bytes(b"0" * 64)
+        mock_openai_client.client.files.create.return_value = MagicMock(id="file-big")
+
+        mock_openai_client.analyze_file(str(f), "p")
+
+        assert mock_openai_client.client.files.create.call_count == 1
+        call = mock_openai_client.client.chat.completions.create.call_args
+        content = call.kwargs["messages"][0]["content"]
+        assert content[0]["file"]["file_id"] == "file-big"
+
+    def test_missing_file_raises(self, mock_openai_client, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            mock_openai_client.analyze_file(str(tmp_path / "nope.txt"), "p")
+
+
+class TestAnalyzeFiles:
+    def test_empty_list(self, mock_openai_client):
+        assert mock_openai_client.analyze_files([], "p") == []
+
+    def test_results_follow_input_order(self, mock_openai_client, tmp_path):
+        paths = []
+        for name in ("a.txt", "b.txt", "c.txt"):
+            f = tmp_path / name
+            f.write_text(name, "utf-8")
+            paths.append(str(f))
+
+        with patch.object(mock_openai_client, "analyze_file",
+                          side_effect=lambda p, _prompt: Path(p).name):
+            results = mock_openai_client.analyze_files(paths, "p")
+        assert results == ["a.txt", "b.txt", "c.txt"]
+
+
 # ---------------------------------------------------------------------------
 # RSS fetch
 # ---------------------------------------------------------------------------
 
 class TestRSSFetch:
     def test_fetch_google_news_rss_network_error(self, mock_openai_client):
-        with patch("urllib.request.urlopen", side_effect=Exception("timeout")):
+        with patch.object(mock_openai_client._http, "get", side_effect=Exception("timeout")):
             items, err = mock_openai_client._fetch_google_news_rss("q", 7)
             assert items == []
             assert "timeout" in err
@@ -93,11 +244,10 @@ class TestRSSFetch:
         </channel></rss>"""
 
         mock_resp = MagicMock()
-        mock_resp.read.return_value = xml_body
-        mock_resp.__enter__ = lambda s: s
-        mock_resp.__exit__ = MagicMock(return_value=False)
+        mock_resp.content = xml_body
+        mock_resp.raise_for_status.return_value = None
 
-        with patch("urllib.request.urlopen", return_value=mock_resp):
+        with patch.object(mock_openai_client._http, "get", return_value=mock_resp):
             items, err = mock_openai_client._fetch_google_news_rss("q", 7)
             assert err is None
             assert len(items) == 1
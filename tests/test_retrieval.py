@@ -89,6 +89,20 @@ class TestSearchManager:
             results = sm.search("q")
             assert results == []
 
+    def test_normalized_url_dedup(self, tmp_path):
+        r1 = SearchResult("A", "https://a.com/news", "a", "p1")
+        r2 = SearchResult("A trk", "https://A.com/news/?utm_source=rss", "a", "p2")
+        r3 = SearchResult("B", "https://b.com/x?id=1", "b", "p2")
+
+        with patch("core.retrieval.SEARCH_CACHE_DIR", tmp_path):
+            sm = SearchManager(
+                providers=[_StubProvider([r1], name="s1"), _StubProvider([r2, r3], name="s2")],
+                cache_ttl_seconds=3600,
+            )
+            results = sm.search("q")
+            # 跟踪参数 / 大小写 / 末尾斜杠差异视为同一 URL，但保留原始 URL
+            assert [r.url for r in results] == ["https://a.com/news", "https://b.com/x?id=1"]
+
     def test_max_results_cap(self, tmp_path):
         items = [SearchResult(f"R{i}", f"https://r{i}.com", "", "s") for i in range(10)]
         with patch("core.retrieval.SEARCH_CACHE_DIR", tmp_path):
@@ -278,6 +278,10 @@ class Display:
                 return answer
             self.print_error("无效选择，请重试")
 
+    def stream_write(self, text: str):
+        """流式输出增量文本（不换行，不做 rich markup 解析）"""
+        self.console.print(text, end="", markup=False, highlight=False, soft_wrap=True)
+
     # ==================== 进度 ====================
 
     def spinner(self, message: str):
@@ -0,0 +1,37 @@
+"""JSON 序列化兼容层
+
+优先使用 orjson（原生实现，解析/序列化比 stdlib 快 2-10x），
+未安装时自动回退 stdlib json，调用方无需感知差异。
+
+- loads(s): 与 json.loads 语义一致（解析失败抛 ValueError 子类）
+- dumps(obj): 紧凑输出（缓存 key / 哈希等场景）
+- dumps_pretty(obj): UTF-8 原样 + indent=2（落盘 / prompt 场景）
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+try:
+    import orjson as _orjson
+
+    def loads(s: Any) -> Any:
+        return _orjson.loads(s)
+
+    def dumps(obj: Any) -> str:
+        return _orjson.dumps(obj).decode("utf-8")
+
+    def dumps_pretty(obj: Any) -> str:
+        return _orjson.dumps(obj, option=_orjson.OPT_INDENT_2).decode("utf-8")
+
+except ImportError:  # pragma: no cover - 取决于运行环境是否安装 orjson
+    import json as _json
+
+    def loads(s: Any) -> Any:
+        return _json.loads(s)
+
+    def dumps(obj: Any) -> str:
+        return _json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def dumps_pretty(obj: Any) -> str:
+        return _json.dumps(obj, ensure_ascii=False, indent=2)
@@ -0,0 +1,45 @@
+"""Prompt 模板预编译
+
+str.format 每次调用都要重新解析整个格式串；对 5KB 级、每次研究都要
+渲染的 prompt 模板，在 import 时一次性编译成 (是否槽位, 文本/槽名)
+序列，渲染就退化为一次生成器 + join。{{ / }} 转义在编译期还原成
+字面大括号，输出与 str.format 逐字节一致。
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Tuple
+
+# {{ / }} 转义，或 {slot_name} 槽位
+_TOKEN_RE = re.compile(r"\{\{|\}\}|\{(\w+)\}")
+
+
+def compile_template(template: str) -> Tuple[Tuple[bool, str], ...]:
+    """模板 -> ((is_slot, 文本或槽名), ...)；相邻文字块已合并"""
+    parts: List[Tuple[bool, str]] = []
+    buf: List[str] = []
+    pos = 0
+    for m in _TOKEN_RE.finditer(template):
+        buf.append(template[pos:m.start()])
+        tok = m.group(0)
+        if tok == "{{":
+            buf.append("{")
+        elif tok == "}}":
+            buf.append("}")
+        else:
+            if buf:
+                parts.append((False, "".join(buf)))
+                buf = []
+            parts.append((True, m.group(1)))
+        pos = m.end()
+    buf.append(template[pos:])
+    tail = "".join(buf)
+    if tail:
+        parts.append((False, tail))
+    return tuple(parts)
+
+
+def render(parts: Tuple[Tuple[bool, str], ...], values: Dict[str, str]) -> str:
+    """用 values 填充编译好的模板；缺槽位时与 .format 一样抛 KeyError"""
+    return "".join(values[text] if is_slot else text for is_slot, text in parts)
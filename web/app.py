@@ -724,6 +724,11 @@ def api_learn_preferences():
     if not preference_learner:
         return jsonify({'error': 'API Key 未配置'}), 400
 
+    # background=1 时放到后台线程执行，立即返回（结果通过偏好列表刷新可见）
+    if (request.args.get('background') or '').lower() in ('1', 'true'):
+        preference_learner.learn_and_save_preferences_async()
+        return jsonify({'status': 'started'})
+
     result = preference_learner.learn_and_save_preferences()
     return jsonify(result)
 